@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from metrics import labels
+
+
+class Rejected(Exception):
+    # status is 429 (client over its rate) or 503 (route saturated);
+    # retry_after is in seconds
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+# === TOKEN BUCKETS (IN-MEMORY) ===
+# One bucket per key, refilled at `rate` tokens a second up to `burst`. Buckets
+# are kept per process in an LRU of max_keys; an evicted bucket starts full.
+class MemoryBuckets:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        # 0 when a token was taken, otherwise seconds until the next one
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def stats(self):
+        with self.lock:
+            return {'backend': 'memory', 'keys': len(self.buckets), 'max_keys': self.max_keys}
+
+
+class ConcurrencyLimit:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.cond.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+
+# === ADMISSION CONTROL ===
+# Runs in front of every authenticated route and login/register: a token
+# bucket per client address and per JWT user (429 when empty; anonymous
+# requests only have the address bucket), then a cap on requests in flight
+# per route. A request that can't get a slot within max_wait seconds is shed
+# with 503 instead of queueing on the connection pool. Limits of 0 disable
+# that check. Every decision is counted per route.
+class AdmissionController:
+    def __init__(self, user_rate=20, user_burst=40, ip_rate=50, ip_burst=100,
+                 concurrency=8, route_concurrency=None, max_wait=0.25, buckets=None):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.concurrency = concurrency
+        self.route_concurrency = dict(route_concurrency or {})
+        self.max_wait = max_wait
+        self.buckets = buckets or MemoryBuckets()
+        self.lock = threading.Lock()
+        self.limits = {}
+        self.decisions = {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            user_rate=config.get('ADMISSION_USER_RATE', 20),
+            user_burst=config.get('ADMISSION_USER_BURST', 40),
+            ip_rate=config.get('ADMISSION_IP_RATE', 50),
+            ip_burst=config.get('ADMISSION_IP_BURST', 100),
+            concurrency=config.get('ADMISSION_CONCURRENCY', 8),
+            route_concurrency=config.get('ADMISSION_ROUTE_CONCURRENCY'),
+            max_wait=config.get('ADMISSION_MAX_WAIT', 0.25),
+            buckets=MemoryBuckets(config.get('ADMISSION_MAX_KEYS', 100000)),
+        )
+
+    def limit_for(self, route):
+        with self.lock:
+            limit = self.limits.get(route)
+            if limit is None:
+                limit = self.limits[route] = ConcurrencyLimit(self.route_concurrency.get(route, self.concurrency))
+            return limit
+
+    def raise_limit(self, route, minimum):
+        # Let at least `minimum` requests into route at once (an unlimited route stays so)
+        with self.lock:
+            current = self.route_concurrency.get(route, self.concurrency)
+            if not current or current >= minimum:
+                return
+            self.route_concurrency[route] = minimum
+            limit = self.limits.get(route)
+        if limit is not None:
+            with limit.cond:
+                limit.limit = minimum
+                limit.cond.notify_all()
+
+    def count(self, route, decision):
+        with self.lock:
+            key = (route, decision)
+            self.decisions[key] = self.decisions.get(key, 0) + 1
+
+    def check_rate(self, route, kind, key, rate, burst):
+        if not rate or key is None:
+            return
+        wait = self.buckets.take(f'{kind}:{key}', rate, burst)
+        if wait:
+            self.count(route, 'rate_limited_' + kind)
+            raise Rejected(429, wait, 'Too many requests, slow down')
+
+    @contextmanager
+    def admit(self, route, user, ip):
+        # Raises Rejected, otherwise holds a slot of route's limit until the block exits
+        self.check_rate(route, 'ip', ip, self.ip_rate, self.ip_burst)
+        self.check_rate(route, 'user', user, self.user_rate, self.user_burst)
+        limit = self.limit_for(route)
+        if limit.limit and not limit.acquire(self.max_wait):
+            self.count(route, 'shed')
+            raise Rejected(503, 1, 'Server busy, try again')
+        self.count(route, 'admitted')
+        try:
+            yield
+        finally:
+            if limit.limit:
+                limit.release()
+
+    def stats(self):
+        with self.lock:
+            decisions = [{'route': route, 'decision': decision, 'count': n}
+                         for (route, decision), n in sorted(self.decisions.items())]
+            routes = {route: {'limit': l.limit, 'active': l.active, 'waiting': l.waiting}
+                      for route, l in sorted(self.limits.items())}
+        return {'decisions': decisions, 'routes': routes, 'buckets': self.buckets.stats()}
+
+    def render(self):
+        # Prometheus text lines, appended to GET /metrics
+        lines = [
+            '# HELP admission_decisions_total Admission decisions, by route and decision.',
+            '# TYPE admission_decisions_total counter',
+        ]
+        with self.lock:
+            for (route, decision), n in sorted(self.decisions.items()):
+                lines.append(f'admission_decisions_total{labels(route=route, decision=decision)} {n}')
+        return '\n'.join(lines) + '\n'
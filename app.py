@@ -1,41 +1,608 @@
-from flask import Flask, request, jsonify, make_response, render_template_string, session, redirect, url_for
-from flask_mysqldb import MySQL
+from flask import Flask, Response, g, request, jsonify, make_response, render_template, session, redirect, url_for, stream_with_context
+from flask import before_render_template, template_rendered
+from markupsafe import Markup
+from MySQLdb.cursors import SSCursor
+import MySQLdb
 import jwt
 import datetime
 from functools import wraps
-import xml.dom.minidom
-from xml.etree.ElementTree import Element, SubElement, tostring
+from xml.sax.saxutils import escape
+import atexit
+import csv
 import hashlib
+import io
+import json
+import math
 import os
+import threading
+import time
+from admission import AdmissionController, Rejected
+from cache import LRUCache, make_cache, make_expiring_set
+from changefeed import ChangeFeed
+from compression import StaticPage, compress_response
+from db_pool import MySQLPool, PoolTimeout
+from group_commit import GroupCommitter, WriteQueueFull
+from metrics import Metrics, add_phase_time, server_timing, timed
+from passwords import HasherBusy, PasswordHasher
+from snapshot import InventorySnapshot
 
 app = Flask(__name__)
 app.config.from_object('config.Config')
 app.secret_key = os.environ.get('SECRET_KEY', 'motorcycle-secret-key-change-in-prod')
-mysql = MySQL(app)
+mysql = MySQLPool(app)
+cache = make_cache(app.config)
+token_cache = LRUCache(max_entries=app.config['TOKEN_CACHE_MAX_ENTRIES'])
+revoked_tokens = make_expiring_set(cache, 'revoked')
+hasher = PasswordHasher.from_config(app.config)
+metrics = Metrics(app.config['METRICS_BUCKETS'])
+admission = AdmissionController.from_config(app.config)
+
+# === XML WRITER ===
+# Writes the document in a single pass straight from the dicts/lists, in the
+# same shape minidom's toprettyxml(indent="  ") used to produce.
+# ?pretty=0 gives the compact form (no indentation or newlines).
+XML_DECLARATION = '<?xml version="1.0" ?>'
+
+def xml_pretty(args):
+    default = '1' if app.config['XML_PRETTY_PRINT'] else '0'
+    return args.get('pretty', default) != '0'
+
+def xml_escape(val):
+    return escape(str(val), {'"': '&quot;'})
+
+def xml_element(tag, val, depth=0, pretty=True):
+    pad = '  ' * depth if pretty else ''
+    nl = '\n' if pretty else ''
+    if isinstance(val, dict):
+        children = list(val.items())
+    elif isinstance(val, (list, tuple)):
+        children = [('item', v) for v in val]
+    else:
+        text = xml_escape(val)
+        if not text:
+            return f'{pad}<{tag}/>{nl}'
+        return f'{pad}<{tag}>{text}</{tag}>{nl}'
+    if not children:
+        return f'{pad}<{tag}/>{nl}'
+    inner = ''.join(xml_element(k, v, depth + 1, pretty) for k, v in children)
+    return f'{pad}<{tag}>{nl}{inner}{pad}</{tag}>{nl}'
+
+def iter_xml(data, pretty=True, item_tag='motorcycle'):
+    nl = '\n' if pretty else ''
+    yield XML_DECLARATION + nl
+    if isinstance(data, list):
+        children = [(item_tag, item) for item in data]
+    else:
+        children = list(data.items())
+    if not children:
+        yield '<response/>' + nl
+        return
+    yield '<response>' + nl
+    for key, val in children:
+        yield xml_element(key, val, 1, pretty)
+    yield '</response>' + nl
 
 # === RESPONSE FORMATTER (JSON/XML) ===
 def format_response(data, fmt='json'):
-    if fmt.lower() == 'xml':
-        root = Element('response')
-        if isinstance(data, list):
-            for item in data:
-                mc_elem = SubElement(root, 'motorcycle')
-                for key, val in item.items():
-                    SubElement(mc_elem, key).text = str(val)
+    with timed('serialize'):
+        if fmt.lower() == 'xml':
+            resp = make_response(''.join(iter_xml(data, xml_pretty(request.args))))
+            resp.headers['Content-Type'] = 'application/xml'
+            return resp
         else:
-            for key, val in data.items():
-                SubElement(root, key).text = str(val)
-        rough = tostring(root, 'utf-8')
-        reparsed = xml.dom.minidom.parseString(rough)
-        xml_str = reparsed.toprettyxml(indent="  ")
-        resp = make_response(xml_str)
-        resp.headers['Content-Type'] = 'application/xml'
-        return resp
+            return jsonify(data)
+
+# === ROW HELPERS ===
+MOTORCYCLE_COLUMNS = ('id', 'make', 'model', 'year', 'engine_cc', 'color')
+MOTORCYCLE_SELECT = "SELECT id, make, model, year, engine_cc, color FROM motorcycles"
+
+def row_to_motorcycle(row):
+    return dict(zip(MOTORCYCLE_COLUMNS, row))
+
+# === KEYSET PAGINATION ===
+# Pages are keyed on the sort column plus id ("after" = cursor of the last row
+# seen) so every page is an index range scan, no matter how deep the client is.
+def get_page_args(args):
+    default = app.config['MOTORCYCLES_PAGE_SIZE']
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        limit = default
+    limit = max(1, min(limit, app.config['MOTORCYCLES_MAX_PAGE_SIZE']))
+    return limit, args.get('after', '')
+
+def fetch_page(cur, limit):
+    # Ask for one extra row so we know whether a next page exists without a COUNT(*)
+    rows = cur.fetchmany(limit + 1)
+    has_more = len(rows) > limit
+    with timed('serialize'):
+        return [row_to_motorcycle(row) for row in rows[:limit]], has_more
+
+def get_offset_arg(args):
+    try:
+        return max(0, int(args.get('offset', 0)))
+    except ValueError:
+        return 0
+
+# === STRUCTURED FILTERS & SORTING ===
+# ?make= &color= (exact), ?year_min= &year_max= &cc_min= &cc_max= (inclusive) and
+# ?sort=<field>[:asc|:desc] (or -<field>). Each compiles to plain parameterized
+# predicates that the indexes in motorcycle.sql serve in page order.
+RANGE_FILTERS = {
+    'year_min': ('year', '>='),
+    'year_max': ('year', '<='),
+    'cc_min': ('engine_cc', '>='),
+    'cc_max': ('engine_cc', '<='),
+}
+SORT_FIELDS = ('id', 'make', 'year', 'engine_cc')
+
+def build_filters(args):
+    where, params = [], []
+    for name in ('make', 'color'):
+        if args.get(name):
+            where.append(f"{name} = %s")
+            params.append(args[name])
+    for name, (col, op) in RANGE_FILTERS.items():
+        if args.get(name, '') != '':
+            try:
+                params.append(int(args[name]))
+            except ValueError:
+                raise ValueError(f'{name} must be an integer')
+            where.append(f"{col} {op} %s")
+    return where, params
+
+def parse_sort(args):
+    raw = args.get('sort', 'id')
+    desc = raw.startswith('-')
+    field, _, direction = raw.lstrip('-').partition(':')
+    if direction:
+        if direction.lower() not in ('asc', 'desc'):
+            raise ValueError('sort direction must be asc or desc')
+        desc = direction.lower() == 'desc'
+    if field not in SORT_FIELDS:
+        raise ValueError('sort must be one of ' + ', '.join(SORT_FIELDS))
+    return field, desc
+
+def order_by(field, desc):
+    d = ' DESC' if desc else ''
+    return f"{field}{d}" if field == 'id' else f"{field}{d}, id{d}"
+
+def keyset_condition(field, desc, after):
+    # Cursor is "<id>" when sorting by id, otherwise "<value>,<id>"
+    op = '<' if desc else '>'
+    try:
+        if field == 'id':
+            return f"id {op} %s", [int(after)]
+        value, comma, last_id = after.rpartition(',')
+        if not comma:
+            raise ValueError
+        value = value if field == 'make' else int(value)
+        return f"({field} {op} %s OR ({field} = %s AND id {op} %s))", [value, value, int(last_id)]
+    except ValueError:
+        raise ValueError('after is not a valid cursor')
+
+def page_cursor(field, mc):
+    return str(mc['id']) if field == 'id' else f"{mc[field]},{mc['id']}"
+
+def list_query(args, limit, after):
+    # SQL for GET /motorcycles: 'sql'/'params' select the whole result (used when
+    # streaming), 'page_sql'/'page_params' just this page plus one look-ahead row.
+    # 'offset' is set when ranked search pages by ?offset. Raises ValueError.
+    search = args.get('search', '')
+    ft_query = fulltext_query(search) if search else None
+    where, params = build_filters(args)
+    sort_field, sort_desc = parse_sort(args)
+    offset = None
+    if ft_query:
+        # Relevance order can't be keyed, so ranked search pages by ?offset
+        offset = get_offset_arg(args)
+        order = order_by(sort_field, sort_desc) if 'sort' in args else "score DESC, id"
+        sql = SEARCH_SELECT + "".join(" AND " + w for w in where) + " ORDER BY " + order
+        params = [ft_query, ft_query] + params
+        page_sql, page_params = sql + " LIMIT %s OFFSET %s", params + [limit + 1, offset]
     else:
-        return jsonify(data)
+        if search:
+            cond, cond_params = search_condition(search)
+            where.append(cond)
+            params += cond_params
+        if after:
+            cond, cond_params = keyset_condition(sort_field, sort_desc, after)
+            where.append(cond)
+            params += cond_params
+        sql = MOTORCYCLE_SELECT
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY " + order_by(sort_field, sort_desc)
+        page_sql, page_params = sql + " LIMIT %s", params + [limit + 1]
+    return {'sql': sql, 'params': params, 'page_sql': page_sql, 'page_params': page_params,
+            'sort_field': sort_field, 'offset': offset}
+
+def next_page_args(args, limit, query, last):
+    # Carry every filter/format argument over, only the position changes
+    args = args.to_dict()
+    args.pop('offset', None)
+    args['limit'] = limit
+    if query['offset'] is not None:
+        args['offset'] = query['offset'] + limit
+    else:
+        args['after'] = page_cursor(query['sort_field'], last)
+    return args
+
+def explain(sql, params):
+    cur = mysql.read_connection.cursor()
+    cur.execute("EXPLAIN " + sql, params)
+    columns = [d[0] for d in cur.description]
+    plan = [dict(zip(columns, row)) for row in cur.fetchall()]
+    cur.close()
+    return plan
+
+# === READ-THROUGH CACHE ===
+# Single rows are cached under motorcycle:<id> and deleted on update/delete.
+# List and search pages are keyed by a generation counter that every write
+# bumps, so one increment retires all pages that could contain the change.
+ENTRY_SELECT = """
+    SELECT id, make, model, year, engine_cc, color, version, UNIX_TIMESTAMP(updated_at)
+    FROM motorcycles"""
+
+def row_to_entry(row):
+    # {'motorcycle': row dict, 'version': int, 'updated_at': unix time}
+    return {'motorcycle': row_to_motorcycle(row), 'version': row[6], 'updated_at': float(row[7])}
+
+def cached_motorcycle_entry(id):
+    key = f'motorcycle:{id}'
+    entry = cache.get(key)
+    if entry is None:
+        cur = mysql.read_connection.cursor()
+        cur.execute(ENTRY_SELECT + " WHERE id = %s", (id,))
+        row = cur.fetchone()
+        cur.close()
+        if not row:
+            return None
+        entry = row_to_entry(row)
+        cache.set(key, entry)
+    return entry
+
+def cached_motorcycles(ids):
+    # Multi-get: cache hits first, then one WHERE id IN (...) query for the rest
+    found, missing = {}, []
+    for id in dict.fromkeys(ids):
+        entry = cache.get(f'motorcycle:{id}')
+        if entry is None:
+            missing.append(id)
+        else:
+            found[id] = entry['motorcycle']
+    if missing:
+        cur = mysql.read_connection.cursor()
+        cur.execute(ENTRY_SELECT + " WHERE id IN (" + ", ".join(["%s"] * len(missing)) + ")", missing)
+        for row in cur.fetchall():
+            entry = row_to_entry(row)
+            cache.set(f'motorcycle:{row[0]}', entry)
+            found[row[0]] = entry['motorcycle']
+        cur.close()
+    return found
+
+def cached_motorcycle(id):
+    entry = cached_motorcycle_entry(id)
+    return entry['motorcycle'] if entry else None
+
+def list_cache_key(*parts):
+    generation = cache.counter('motorcycles:generation')
+    return f'motorcycles:{generation}:' + ':'.join(str(p) for p in parts)
+
+def invalidate_motorcycle(id=None):
+    if id is not None:
+        cache.delete(f'motorcycle:{id}')
+    cache.incr('motorcycles:generation')
+
+# === COLUMNAR SNAPSHOT ===
+# Optional in-memory column store of the inventory for analytics scans
+# (GET /motorcycles/snapshot). Local writes are applied row by row; with
+# SNAPSHOT_MAX_AGE set it is also reloaded periodically to pick up writes made
+# by other processes.
+snapshot = InventorySnapshot(max_age=app.config['SNAPSHOT_MAX_AGE']) if app.config['SNAPSHOT_ENABLED'] else None
+snapshot_load_lock = threading.Lock()
+
+def iter_rows(cur, batch_size=1000):
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+def current_snapshot():
+    if snapshot.stale():
+        with snapshot_load_lock:
+            if snapshot.stale():
+                cur = mysql.connection.cursor(SSCursor)
+                cur.execute(MOTORCYCLE_SELECT + " ORDER BY id")
+                snapshot.load(iter_rows(cur))
+                cur.close()
+    return snapshot
+
+def snapshot_upsert(mc):
+    if snapshot is not None:
+        snapshot.upsert(mc)
+
+def snapshot_delete(id):
+    if snapshot is not None:
+        snapshot.delete(id)
+
+def snapshot_invalidate():
+    if snapshot is not None:
+        snapshot.invalidate()
+
+# === CONDITIONAL GET ===
+# Rows carry a version and updated_at; table_versions holds one counter for the
+# whole motorcycles table. Every write bumps the counter in its own transaction,
+# before touching motorcycles: the row lock it takes serializes writers, so
+# change-feed seqs (assigned by triggers) become visible in commit order.
+# ETags are weak because the compression layer may re-encode the body.
+def bump_table_version(cur):
+    cur.execute("UPDATE table_versions SET version = version + 1 WHERE table_name = 'motorcycles'")
+
+def motorcycles_table_version():
+    # Cached under the list generation like the pages themselves, so cached
+    # list traffic stays off MySQL and every local write retires it
+    key = list_cache_key('table_version')
+    cached = cache.get(key)
+    if cached is not None:
+        return tuple(cached)
+    cur = mysql.read_connection.cursor()
+    cur.execute("""
+        SELECT version, UNIX_TIMESTAMP(updated_at) FROM table_versions
+        WHERE table_name = 'motorcycles'""")
+    row = cur.fetchone()
+    cur.close()
+    version = (row[0], float(row[1])) if row else (0, None)
+    cache.set(key, list(version))
+    return version
+
+def resource_etag(*parts):
+    # The query string is part of the representation (format, paging, search...)
+    digest = hashlib.sha1(request.query_string).hexdigest()[:12]
+    return '-'.join(str(p) for p in parts) + '-' + digest
+
+def is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+def set_validators(resp, etag, last_modified):
+    resp = make_response(resp)
+    resp.set_etag(etag, weak=True)
+    if last_modified is not None:
+        resp.last_modified = datetime.datetime.fromtimestamp(int(last_modified), datetime.timezone.utc)
+    return resp
+
+def not_modified_response(etag, last_modified):
+    return set_validators(Response(status=304), etag, last_modified)
+
+# === CHANGE FEED ===
+# motorcycle_changes is filled by triggers (see motorcycle.sql). Reads use
+# their own short checkouts so a long-poll or SSE subscriber doesn't hold a
+# pooled connection while it waits.
+CHANGE_SELECT = """
+    SELECT seq, op, motorcycle_id, data, UNIX_TIMESTAMP(changed_at)
+    FROM motorcycle_changes"""
+
+def row_to_change(row):
+    change = {'seq': row[0], 'op': row[1], 'id': row[2], 'changed_at': float(row[4])}
+    if row[3] is not None:
+        change['motorcycle'] = json.loads(row[3])
+    return change
+
+def fetch_changes(since, limit):
+    with mysql.checkout() as conn:
+        cur = conn.cursor()
+        cur.execute(CHANGE_SELECT + " WHERE seq > %s ORDER BY seq LIMIT %s", (since, limit))
+        rows = cur.fetchall()
+        cur.close()
+    return [row_to_change(row) for row in rows]
+
+def latest_change_seq():
+    with mysql.checkout() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COALESCE(MAX(seq), 0) FROM motorcycle_changes")
+        seq = cur.fetchone()[0]
+        cur.close()
+    return seq
+
+changes = ChangeFeed(fetch_changes, latest_change_seq, buffer_size=app.config['CHANGES_BUFFER_SIZE'],
+                     poll_interval=app.config['CHANGES_POLL_INTERVAL'])
+
+# === TEMPLATES ===
+# Pages live in templates/ and extend base.html. Jinja compiles each one once
+# and keeps it in app.jinja_env's cache; TEMPLATES_WARM compiles them all at
+# startup so no request pays for it. Rendered inventory rows are cached by
+# content, so an edited row simply gets a new key.
+fragment_cache = LRUCache(max_entries=app.config['FRAGMENT_CACHE_MAX_ENTRIES'],
+                          ttl=app.config['FRAGMENT_CACHE_TTL'])
+
+def warm_templates():
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+@app.template_global()
+def motorcycle_row(m):
+    key = tuple(m[c] for c in MOTORCYCLE_COLUMNS)
+    html = fragment_cache.get(key)
+    if html is None:
+        html = app.jinja_env.get_template('motorcycle_row.html').render(m=m)
+        fragment_cache.set(key, html)
+    return Markup(html)
+
+if app.config['TEMPLATES_WARM']:
+    warm_templates()
+
+# === REQUEST TIMING ===
+# Every request is timed end to end and split into phases (auth, db_acquire,
+# query, serialize, render; see metrics.py). Registered ahead of compress so
+# it runs after it and the total includes compression. Streamed bodies are
+# produced after this point and only count up to the first byte.
+@app.before_request
+def start_timer():
+    g._request_start = time.perf_counter()
+    g._phase_times = {}
+
+@before_render_template.connect_via(app)
+def render_started(sender, template, context, **extra):
+    g._render_start = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def render_finished(sender, template, context, **extra):
+    start = g.pop('_render_start', None)
+    if start is not None:
+        add_phase_time('render', time.perf_counter() - start)
+
+@app.after_request
+def record_timing(response):
+    start = g.pop('_request_start', None)
+    if start is None:
+        return response
+    duration = time.perf_counter() - start
+    phase_times = g.get('_phase_times', {})
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe(route, request.method, response.status_code, duration, phase_times)
+    if app.debug or app.config['SERVER_TIMING']:
+        response.headers['Server-Timing'] = server_timing(phase_times, duration)
+    return response
+
+# === STATIC PAGES & COMPRESSION ===
+# Pages with no per-request data are rendered and compressed once at startup.
+def render_static(name, **context):
+    return app.jinja_env.get_template(name).render(**context)
+
+static_pages = {
+    'index': StaticPage(render_static('index.html', logged_in=False), vary_cookie=True),
+    'index_member': StaticPage(render_static('index.html', logged_in=True), vary_cookie=True),
+    'login': StaticPage(render_static('login.html')),
+    'register': StaticPage(render_static('register.html')),
+}
+
+@app.after_request
+def compress(response):
+    return compress_response(response, request, app.config)
+
+# === FULL-TEXT SEARCH ===
+# ?search= is answered from the ngram FULLTEXT index on (make, model, color)
+# declared in motorcycle.sql. Every term becomes a required quoted phrase, which
+# with the ngram parser is a substring match, and results are ranked by relevance.
+SEARCH_SELECT = """
+    SELECT id, make, model, year, engine_cc, color,
+           MATCH(make, model, color) AGAINST (%s IN BOOLEAN MODE) AS score
+    FROM motorcycles WHERE MATCH(make, model, color) AGAINST (%s IN BOOLEAN MODE)"""
+
+def search_condition(search):
+    # WHERE predicate for ?search= without ranking (used where order doesn't matter)
+    ft_query = fulltext_query(search)
+    if ft_query:
+        return "MATCH(make, model, color) AGAINST (%s IN BOOLEAN MODE)", [ft_query]
+    return "(make LIKE %s OR model LIKE %s OR color LIKE %s)", [f"%{search}%", f"%{search}%", f"%{search}%"]
+
+def fulltext_query(search):
+    # Terms shorter than the ngram token size can't be found in the index;
+    # returns None when nothing usable is left so the caller falls back to LIKE.
+    terms = [t.replace('"', '') for t in search.split()]
+    terms = [t for t in terms if len(t) >= app.config['SEARCH_MIN_TERM_LENGTH']]
+    if not terms:
+        return None
+    return ' '.join(f'+"{t}"' for t in terms)
+
+# === STREAMING EXPORT (JSON/XML/NDJSON) ===
+STREAM_MIMETYPES = {
+    'json': 'application/json',
+    'xml': 'application/xml',
+    'ndjson': 'application/x-ndjson',
+}
+
+def stream_motorcycles(cur, fmt):
+    # cur is an unbuffered server-side cursor: rows are pulled from MySQL in
+    # batches, so memory stays flat however big the export is.
+    batch_size = app.config['STREAM_BATCH_SIZE']
+    pretty = xml_pretty(request.args)
+    nl = '\n' if pretty else ''
+    try:
+        if fmt == 'json':
+            yield '['
+        elif fmt == 'xml':
+            yield XML_DECLARATION + nl + '<response>' + nl
+        first = True
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            chunk = []
+            for row in rows:
+                mc = row_to_motorcycle(row)
+                if fmt == 'json':
+                    chunk.append(('' if first else ',') + app.json.dumps(mc))
+                elif fmt == 'xml':
+                    chunk.append(xml_element('motorcycle', mc, 1, pretty))
+                else:
+                    chunk.append(app.json.dumps(mc) + '\n')
+                first = False
+            yield ''.join(chunk)
+        if fmt == 'json':
+            yield ']\n'
+        elif fmt == 'xml':
+            yield '</response>' + nl
+    finally:
+        cur.close()
+
+# === VERIFIED-TOKEN CACHE ===
+# Tokens that passed jwt.decode are remembered by SHA-256 digest until their
+# own exp, so repeat requests skip the HMAC check. Revoked digests are kept
+# until exp too, in a set that is never evicted early (in Redis when the cache
+# is): otherwise a cache miss would simply re-verify the token.
+def token_digest(token):
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).hexdigest()
+
+def verify_token(token):
+    key = token_digest(token)
+    if key in revoked_tokens:
+        return None
+    claims = token_cache.get(key)
+    if claims is None:
+        try:
+            claims = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"],
+                                options={"require": ["exp"]})
+        except jwt.InvalidTokenError:
+            return None
+        token_cache.set(key, claims, ttl=claims['exp'] - time.time())
+    return claims
+
+def revoke_token(token):
+    # With CACHE_BACKEND = 'redis' the revocation is shared by every worker.
+    # The memory backend keeps it in this process only, so other workers
+    # accept the token until it expires.
+    claims = verify_token(token)
+    if claims is None:
+        return
+    key = token_digest(token)
+    token_cache.delete(key)
+    revoked_tokens.add(key, claims['exp'])
+
+# === ADMISSION DECORATOR ===
+# Wraps a route in admission control. The JWT user's bucket applies when
+# token_required ran first; login/register only have the client address.
+def admitted(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not app.config['ADMISSION_ENABLED']:
+            return f(*args, **kwargs)
+        # Streamed bodies (exports, SSE) only hold their slot until the first byte
+        with admission.admit(request.url_rule.rule, g.get('current_user'), request.remote_addr):
+            return f(*args, **kwargs)
+    return decorated
 
 # === JWT AUTH DECORATOR ===
 def token_required(f):
+    f = admitted(f)
+
     @wraps(f)
     def decorated(*args, **kwargs):
         token = None
@@ -45,80 +612,81 @@ def token_required(f):
             token = session['token']
 
         if not token:
-            if request.args.get('format') in ['json', 'xml']:
+            if request.args.get('format') in ['json', 'xml', 'ndjson']:
                 return format_response({'message': 'Token is missing!'}, request.args.get('format')), 401
             else:
                 return redirect(url_for('login'))
 
-        try:
-            jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-        except:
-            if request.args.get('format') in ['json', 'xml']:
+        with timed('auth'):
+            claims = verify_token(token)
+        if claims is None:
+            if request.args.get('format') in ['json', 'xml', 'ndjson']:
                 return format_response({'message': 'Token is invalid!'}, request.args.get('format')), 401
             else:
                 session.pop('token', None)
                 return redirect(url_for('login'))
+        # Decoded claims for the handler, so nothing downstream decodes again
+        g.token_claims = claims
+        g.current_user = claims.get('user')
         return f(*args, **kwargs)
     return decorated
 
+@app.errorhandler(Rejected)
+def admission_rejected(e):
+    fmt = request.args.get('format', 'html')
+    if fmt in ['json', 'xml']:
+        resp = make_response(format_response({'error': e.reason}, fmt), e.status)
+    else:
+        resp = make_response(f'<h3 style="color:#f44336;">{e.reason}</h3><a href="/motorcycles" style="color:#4CAF50;">Back</a>', e.status)
+    resp.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return resp
+
+# === READ REPLICAS ===
+# With MYSQL_REPLICAS configured, GETs of the list, detail and edit pages read
+# through mysql.read_connection from a replica (falling back to the primary
+# when none is healthy). A client that just wrote is pinned to the primary for
+# READ_YOUR_WRITES_WINDOW seconds so it sees its own edits: in its session
+# cookie, and per JWT user for clients that don't keep cookies.
+recent_writers = LRUCache(max_entries=app.config['TOKEN_CACHE_MAX_ENTRIES'],
+                          ttl=app.config['READ_YOUR_WRITES_WINDOW'])
+READ_ONLY_POSTS = ('batch_get_motorcycles',)
+
+def wrote_recently():
+    if session.get('primary_until', 0) > time.time():
+        return True
+    return g.get('current_user') is not None and recent_writers.get(g.current_user) is not None
+
+def replica_reads(f):
+    # Goes under token_required so the JWT user is known
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if request.method == 'GET' and not wrote_recently():
+            mysql.use_replica()
+        return f(*args, **kwargs)
+    return decorated
+
+@app.after_request
+def pin_writer_to_primary(response):
+    if (mysql.replicas is not None and request.method in ('POST', 'PUT', 'PATCH', 'DELETE')
+            and response.status_code < 400 and g.get('current_user') is not None
+            and request.endpoint not in READ_ONLY_POSTS):
+        session['primary_until'] = time.time() + app.config['READ_YOUR_WRITES_WINDOW']
+        recent_writers.set(g.current_user, True)
+    return response
+
 # === REGISTER ===
 @app.route('/register', methods=['GET', 'POST'])
+@admitted
 def register():
     if request.method == 'GET':
-        return render_template_string('''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>🏍️ Register • Motorcycle Hub</title>
-            <style>
-                body { font-family: 'Segoe UI', sans-serif; background: #121212; color: #e0e0e0; margin: 0; padding: 0; }
-                .container {
-                    max-width: 500px; margin: 60px auto; background: #1e1e1e;
-                    padding: 30px; border-radius: 12px; box-shadow: 0 0 25px rgba(0,0,0,0.5);
-                    border: 1px solid #333;
-                }
-                h2 {
-                    text-align: center; color: #4CAF50; margin-bottom: 25px;
-                    border-bottom: 2px solid #2a2a2a; padding-bottom: 10px;
-                }
-                input {
-                    width: 100%; padding: 12px; margin: 10px 0;
-                    border: 1px solid #444; border-radius: 6px;
-                    background: #2a2a2a; color: #fff; box-sizing: border-box;
-                }
-                button {
-                    width: 100%; padding: 12px; background: #4CAF50;
-                    color: white; border: none; border-radius: 6px;
-                    font-size: 16px; cursor: pointer; margin-top: 10px;
-                }
-                button:hover { background: #45a049; }
-                a {
-                    display: block; text-align: center; margin-top: 20px;
-                    color: #4CAF50; text-decoration: none;
-                }
-                a:hover { text-decoration: underline; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h2>🏍️ Register</h2>
-                <form method="POST">
-                    <input type="text" name="username" placeholder="Username" required>
-                    <input type="password" name="password" placeholder="Password" required>
-                    <button type="submit">Create Account</button>
-                </form>
-                <a href="/login">← Already have an account?</a>
-            </div>
-        </body>
-        </html>
-        ''')
+        return static_pages['register'].response(request)
 
     username = request.form.get('username')
     password = request.form.get('password')
     if not username or not password:
         return '<h3 style="text-align:center;color:#f44336;">Error: Username and password required</h3><a href="/register" style="display:block;text-align:center;color:#4CAF50;">Try again</a>', 400
 
-    hashed = hashlib.sha256(password.encode()).hexdigest()
+    hashed = hasher.hash(password)
     cur = mysql.connection.cursor()
     try:
         cur.execute("INSERT INTO users (username, password) VALUES (%s, %s)", (username, hashed))
@@ -133,63 +701,25 @@ def register():
 
 # === LOGIN ===
 @app.route('/login', methods=['GET', 'POST'])
+@admitted
 def login():
     if request.method == 'GET':
-        return render_template_string('''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>🏍️ Login • Motorcycle Hub</title>
-            <style>
-                body { font-family: 'Segoe UI', sans-serif; background: #121212; color: #e0e0e0; margin: 0; padding: 0; }
-                .container {
-                    max-width: 500px; margin: 60px auto; background: #1e1e1e;
-                    padding: 30px; border-radius: 12px; box-shadow: 0 0 25px rgba(0,0,0,0.5);
-                    border: 1px solid #333;
-                }
-                h2 {
-                    text-align: center; color: #4CAF50; margin-bottom: 25px;
-                    border-bottom: 2px solid #2a2a2a; padding-bottom: 10px;
-                }
-                input {
-                    width: 100%; padding: 12px; margin: 10px 0;
-                    border: 1px solid #444; border-radius: 6px;
-                    background: #2a2a2a; color: #fff; box-sizing: border-box;
-                }
-                button {
-                    width: 100%; padding: 12px; background: #4CAF50;
-                    color: white; border: none; border-radius: 6px;
-                    font-size: 16px; cursor: pointer; margin-top: 10px;
-                }
-                button:hover { background: #45a049; }
-                a {
-                    display: block; text-align: center; margin-top: 20px;
-                    color: #4CAF50; text-decoration: none;
-                }
-                a:hover { text-decoration: underline; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h2>🏍️ Login</h2>
-                <form method="POST">
-                    <input type="text" name="username" placeholder="Username" required>
-                    <input type="password" name="password" placeholder="Password" required>
-                    <button type="submit">Sign In</button>
-                </form>
-                <a href="/register">← Don't have an account?</a>
-            </div>
-        </body>
-        </html>
-        ''')
+        return static_pages['login'].response(request)
 
     username = request.form.get('username')
     password = request.form.get('password')
-    hashed = hashlib.sha256(password.encode()).hexdigest()
 
     cur = mysql.connection.cursor()
-    cur.execute("SELECT * FROM users WHERE username = %s AND password = %s", (username, hashed))
+    cur.execute("SELECT id, password FROM users WHERE username = %s", (username,))
     user = cur.fetchone()
+    # Always one KDF run, whether or not the user exists
+    if hasher.verify(password or '', user[1] if user else None) and password:
+        if hasher.needs_rehash(user[1]):
+            # Stored with an old KDF or cost; upgrade now that we know the password
+            cur.execute("UPDATE users SET password = %s WHERE id = %s", (hasher.hash(password), user[0]))
+            mysql.connection.commit()
+    else:
+        user = None
     cur.close()
 
     if not user:
@@ -205,7 +735,9 @@ def login():
 # === LOGOUT ===
 @app.route('/logout')
 def logout():
-    session.pop('token', None)
+    token = session.pop('token', None) or request.headers.get('x-access-token')
+    if token:
+        revoke_token(token)
     return redirect(url_for('login'))
 
 # === CREATE MOTORCYCLE ===
@@ -213,56 +745,7 @@ def logout():
 @token_required
 def create_motorcycle():
     if request.method == 'GET':
-        return render_template_string('''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Add Motorcycle • Motorcycle Hub</title>
-            <style>
-                body { font-family: 'Segoe UI', sans-serif; background: #121212; color: #e0e0e0; padding: 20px; }
-                .container {
-                    max-width: 600px; margin: 40px auto; background: #1e1e1e;
-                    padding: 30px; border-radius: 12px; box-shadow: 0 0 25px rgba(0,0,0,0.5);
-                    border: 1px solid #333;
-                }
-                h2 {
-                    color: #4CAF50; margin-bottom: 20px;
-                    border-bottom: 1px solid #333; padding-bottom: 8px;
-                }
-                input {
-                    width: 100%; padding: 10px; margin: 12px 0;
-                    border: 1px solid #444; border-radius: 6px;
-                    background: #2a2a2a; color: #fff;
-                }
-                button {
-                    width: 100%; padding: 12px; background: #4CAF50;
-                    color: white; border: none; border-radius: 6px;
-                    font-size: 16px; cursor: pointer; margin-top: 15px;
-                }
-                button:hover { background: #45a049; }
-                a {
-                    display: inline-block; margin-top: 15px;
-                    color: #4CAF50; text-decoration: none;
-                }
-                a:hover { text-decoration: underline; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h2>➕ Add New Motorcycle</h2>
-                <form method="POST">
-                    <input name="make" placeholder="Make (e.g., Yamaha)" required>
-                    <input name="model" placeholder="Model (e.g., R1)" required>
-                    <input name="year" type="number" placeholder="Year (e.g., 2023)" required>
-                    <input name="engine_cc" type="number" placeholder="Engine (cc)" required>
-                    <input name="color" placeholder="Color" required>
-                    <button type="submit">Add Motorcycle</button>
-                </form>
-                <a href="/motorcycles">← Cancel</a>
-            </div>
-        </body>
-        </html>
-        ''')
+        return render_template('create.html')
 
     data = {
         'make': request.form['make'],
@@ -277,212 +760,665 @@ def create_motorcycle():
     except:
         return '<h3 style="color:#f44336;">Error: Year and Engine must be numbers</h3><a href="/motorcycles/new" style="color:#4CAF50;">Try again</a>', 400
 
+    if create_buffer is not None:
+        try:
+            create_buffer.submit((data['make'], data['model'], year, cc, data['color']))
+        except WriteQueueFull:
+            raise
+        except Exception as e:
+            return f'<h3 style="color:#f44336;">Error: {str(e)}</h3><a href="/motorcycles/new" style="color:#4CAF50;">Try again</a>', 400
+        return redirect(url_for('list_motorcycles'))
+
     cur = mysql.connection.cursor()
     try:
+        bump_table_version(cur)
         cur.execute("""
             INSERT INTO motorcycles (make, model, year, engine_cc, color)
             VALUES (%s, %s, %s, %s, %s)
         """, (data['make'], data['model'], year, cc, data['color']))
+        new_id = cur.lastrowid
         mysql.connection.commit()
         cur.close()
+        invalidate_motorcycle()
+        snapshot_upsert({'id': new_id, 'make': data['make'], 'model': data['model'],
+                         'year': year, 'engine_cc': cc, 'color': data['color']})
+        changes.notify()
         return redirect(url_for('list_motorcycles'))
     except Exception as e:
         cur.close()
         return f'<h3 style="color:#f44336;">Error: {str(e)}</h3><a href="/motorcycles/new" style="color:#4CAF50;">Try again</a>', 400
 
+# === GROUP COMMIT (CREATE) ===
+# With CREATE_GROUP_COMMIT on, create_motorcycle hands its row to a shared
+# GroupCommitter and waits; rows are flushed as one multi-row INSERT and one
+# commit per batch. InnoDB gives a multi-row INSERT a consecutive block of ids
+# starting at lastrowid, and the table_versions lock keeps every other app
+# writer out until the batch commits.
+# Errors caused by one row's data. A batch failing with one of these is retried
+# row by row; anything else (pool timeout, lost connection) fails it whole.
+ROW_ERRORS = (MySQLdb.IntegrityError, MySQLdb.DataError)
+
+def insert_motorcycles(rows):
+    with mysql.checkout() as conn:
+        cur = conn.cursor()
+        try:
+            bump_table_version(cur)
+            cur.execute("INSERT INTO motorcycles (make, model, year, engine_cc, color) VALUES "
+                        + ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows)), [v for row in rows for v in row])
+            first_id = cur.lastrowid
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    ids = list(range(first_id, first_id + len(rows)))
+    invalidate_motorcycle()
+    for id, row in zip(ids, rows):
+        snapshot_upsert(dict(zip(MOTORCYCLE_COLUMNS, (id,) + row)))
+    changes.notify()
+    return ids
+
+create_buffer = None
+if app.config['CREATE_GROUP_COMMIT']:
+    create_buffer = GroupCommitter(insert_motorcycles, max_batch=app.config['CREATE_BATCH_SIZE'],
+                                   max_delay=app.config['CREATE_BATCH_DELAY_MS'] / 1000,
+                                   max_queue=app.config['CREATE_QUEUE_SIZE'],
+                                   timeout=app.config['CREATE_QUEUE_TIMEOUT'],
+                                   row_errors=ROW_ERRORS)
+    atexit.register(create_buffer.close)
+    # Queued creates hold no pool connection, and admission has to let a whole
+    # batch in at once or batches could never fill past its per-route cap
+    admission.raise_limit('/motorcycles/new', app.config['CREATE_BATCH_SIZE'])
+
+@app.errorhandler(WriteQueueFull)
+def write_queue_full(e):
+    resp = make_response('<h3 style="color:#f44336;">Server busy, please try again</h3><a href="/motorcycles/new" style="color:#4CAF50;">Back</a>', 503)
+    resp.headers['Retry-After'] = '1'
+    return resp
+
+# === BULK IMPORT ===
+# POST /motorcycles/bulk takes a JSON array, NDJSON or CSV body (picked by
+# Content-Type). The body is parsed incrementally and rows are inserted with
+# executemany, committing every BULK_BATCH_SIZE rows.
+MOTORCYCLE_FIELDS = ('make', 'model', 'year', 'engine_cc', 'color')
+# VARCHAR sizes from motorcycle.sql, checked before a row reaches the batch
+MOTORCYCLE_LENGTHS = {'make': 100, 'model': 100, 'color': 50}
+
+JSON_LITERALS = ('true', 'false', 'null', 'NaN', 'Infinity', '-Infinity')
+NUMBER_TAIL = set('0123456789.eE+-')
+
+def cut_short(tail, error=None):
+    # Whether tail (the buffer from where decoding stopped) may be the start of
+    # a value split by the chunk edge; anything else is an error in the body
+    if error is not None:
+        if error.msg.startswith('Unterminated string'):
+            return True
+        if error.msg.startswith('Invalid \\uXXXX'):
+            return len(tail) < 6
+        if any(literal.startswith(tail) for literal in JSON_LITERALS):
+            return True
+    return set(tail) <= NUMBER_TAIL
+
+def iter_json_array(text, chunk_size=65536):
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    # What may come next: 'open' '[', 'first' a value or ']', 'value' a value
+    # (after a comma), 'separator' ',' or ']'
+    expect = 'open'
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n':
+            pos += 1
+        if pos < len(buf):
+            char = buf[pos]
+            if expect == 'open':
+                if char != '[':
+                    raise ValueError('Body must be a JSON array')
+                expect = 'first'
+                pos += 1
+                continue
+            if char == ']' and expect in ('first', 'separator'):
+                return
+            if expect == 'separator':
+                if char != ',':
+                    raise ValueError("Expected ',' or ']' after JSON array element")
+                expect = 'value'
+                pos += 1
+                continue
+            if char in ',]':
+                raise ValueError('Missing JSON array element')
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                # Only a value cut at the chunk edge is worth reading more for;
+                # a bad element fails here rather than buffering the rest
+                if eof or not cut_short(buf[e.pos:], e):
+                    raise ValueError('Invalid or truncated JSON array element')
+            else:
+                # A number may continue in the next chunk (1 | .5, 1 | e3)
+                if eof or not cut_short(buf[end:]):
+                    yield item
+                    pos = end
+                    expect = 'separator'
+                    continue
+        if eof:
+            raise ValueError('Unexpected end of JSON array')
+        chunk = text.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+def iter_bulk_rows(text, content_type):
+    # Yields (row_number, dict or exception) so a bad row doesn't end the import
+    if content_type == 'text/csv':
+        for n, row in enumerate(csv.DictReader(text), 1):
+            yield n, row
+    elif content_type in ('application/x-ndjson', 'application/jsonl'):
+        for n, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                yield n, json.loads(line)
+            except ValueError as e:
+                yield n, e
+    else:
+        for n, item in enumerate(iter_json_array(text), 1):
+            yield n, item
+
+def parse_int(value):
+    # Same rule as the form fields: an int or an integer string, never a bool or float
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('Not an integer')
+    return int(value)
+
+def validate_motorcycle(item):
+    if not isinstance(item, dict):
+        raise ValueError('Row must be an object')
+    missing = [f for f in MOTORCYCLE_FIELDS if item.get(f) in (None, '')]
+    if missing:
+        raise ValueError('Missing ' + ', '.join(missing))
+    try:
+        year = parse_int(item['year']); cc = parse_int(item['engine_cc'])
+    except (TypeError, ValueError):
+        raise ValueError('Year and Engine must be integers')
+    too_long = [f for f, size in MOTORCYCLE_LENGTHS.items() if len(str(item[f])) > size]
+    if too_long:
+        raise ValueError('Too long: ' + ', '.join(too_long))
+    return (str(item['make']), str(item['model']), year, cc, str(item['color']))
+
+def insert_bulk_rows(conn, cur, rows, numbers, report):
+    # Inserts rows with one commit and returns how many went in. When one row's
+    # data fails the batch, the rows are retried one by one so only it is reported.
+    try:
+        bump_table_version(cur)
+        cur.executemany("""
+            INSERT INTO motorcycles (make, model, year, engine_cc, color)
+            VALUES (%s, %s, %s, %s, %s)
+        """, rows)
+        conn.commit()
+        return len(rows)
+    except ROW_ERRORS as e:
+        conn.rollback()
+        if len(rows) > 1:
+            return sum(insert_bulk_rows(conn, cur, [row], [n], report) for row, n in zip(rows, numbers))
+        report(numbers[0], str(e))
+    except Exception as e:
+        conn.rollback()
+        for n in numbers:
+            report(n, str(e))
+    return 0
+
+@app.route('/motorcycles/bulk', methods=['POST'])
+@token_required
+def bulk_import_motorcycles():
+    fmt = request.args.get('format', 'json')
+    content_type = request.mimetype or 'application/json'
+    if content_type not in ('application/json', 'application/x-ndjson', 'application/jsonl', 'text/csv'):
+        return format_response({'error': 'Unsupported Content-Type ' + content_type}, fmt), 415
+
+    batch_size = app.config['BULK_BATCH_SIZE']
+    max_errors = app.config['BULK_MAX_ERRORS']
+    inserted, failed, errors = 0, 0, []
+    batch, batch_rows = [], []
+    body_error = None
+
+    def report(row, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < max_errors:
+            errors.append({'row': row, 'error': message})
+
+    cur = mysql.connection.cursor()
+
+    def flush():
+        nonlocal inserted
+        inserted += insert_bulk_rows(mysql.connection, cur, batch, batch_rows, report)
+        batch.clear()
+        batch_rows.clear()
+
+    text = io.TextIOWrapper(request.stream, encoding='utf-8', newline='' if content_type == 'text/csv' else None)
+    try:
+        for n, item in iter_bulk_rows(text, content_type):
+            try:
+                if isinstance(item, Exception):
+                    raise item
+                batch.append(validate_motorcycle(item))
+                batch_rows.append(n)
+            except ValueError as e:
+                report(n, str(e))
+                continue
+            if len(batch) >= batch_size:
+                flush()
+    except (ValueError, UnicodeDecodeError) as e:
+        # The body itself is malformed; rows before this point are still imported
+        body_error = str(e)
+    if batch:
+        flush()
+    cur.close()
+    if inserted:
+        invalidate_motorcycle()
+        snapshot_invalidate()
+        changes.notify()
+
+    result = {
+        'inserted': inserted,
+        'failed': failed,
+        'errors': errors,
+        'errors_truncated': failed > len(errors),
+    }
+    if body_error:
+        result['error'] = body_error
+    return format_response(result, fmt), 400 if body_error else 200
+
+# === BATCHED MULTI-GET ===
+# GET /motorcycles?ids=1,5,9 or POST /motorcycles/batch with a JSON body of ids
+# ([1, 5, 9] or {"ids": [...]}). Results come back in request order and ids
+# that don't exist get an explicit {"id": ..., "error": "Not found"} entry.
+def parse_ids(values, max_ids=None):
+    max_ids = max_ids or app.config['MULTIGET_MAX_IDS']
+    if not isinstance(values, list):
+        raise ValueError('ids must be a list')
+    if len(values) > max_ids:
+        raise ValueError(f"At most {max_ids} ids per request")
+    try:
+        return [parse_int(v) for v in values]
+    except (TypeError, ValueError):
+        raise ValueError('ids must be integers')
+
+def multi_get_response(ids, fmt):
+    found = cached_motorcycles(ids)
+    results = [found.get(id) or {'id': id, 'error': 'Not found'} for id in ids]
+    if fmt == 'ndjson':
+        return Response(''.join(app.json.dumps(r) + '\n' for r in results), mimetype='application/x-ndjson')
+    if fmt in ['json', 'xml']:
+        return format_response(results, fmt)
+    return render_template('list.html', motorcycles=[found[id] for id in ids if id in found],
+                           search='', next_url=None)
+
+@app.route('/motorcycles/batch', methods=['POST'])
+@token_required
+def batch_get_motorcycles():
+    fmt = request.args.get('format', 'json')
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('ids')
+    try:
+        ids = parse_ids(body)
+    except ValueError as e:
+        return format_response({'error': str(e)}, fmt if fmt == 'xml' else 'json'), 400
+    return multi_get_response(ids, fmt)
+
+# === BULK UPDATE / DELETE ===
+# PATCH /motorcycles/bulk  {"ids": [...] or "filter": {...}, "set": {"color": "Black", ...}}
+# DELETE /motorcycles/bulk {"ids": [...] or "filter": {...}}
+# "filter" takes the list endpoint's arguments (make, color, year_min/max,
+# cc_min/max, search). Rows are written with one set-based UPDATE/DELETE per
+# chunk of BULK_WRITE_CHUNK_SIZE ids, each chunk its own transaction so no
+# request holds the table_versions lock for long. ?dry_run=1 only counts.
+BULK_FILTER_ARGS = ('make', 'color', 'search') + tuple(RANGE_FILTERS)
+
+def bulk_target(body):
+    # WHERE predicates and params selecting the rows a bulk write applies to
+    if 'ids' in body:
+        ids = parse_ids(body['ids'], app.config['BULK_WRITE_MAX_IDS'])
+        if not ids:
+            raise ValueError('ids must not be empty')
+        return ["id IN (" + ", ".join(["%s"] * len(ids)) + ")"], ids
+    filters = body.get('filter')
+    if not isinstance(filters, dict):
+        raise ValueError('ids or filter is required')
+    unknown = [name for name in filters if name not in BULK_FILTER_ARGS]
+    if unknown:
+        raise ValueError('Unknown filter ' + ', '.join(unknown))
+    args = {name: str(value) for name, value in filters.items() if value is not None}
+    where, params = build_filters(args)
+    if args.get('search'):
+        cond, cond_params = search_condition(args['search'])
+        where.append(cond)
+        params += cond_params
+    if not where:
+        # An empty filter would match the whole table; that is never what was meant
+        raise ValueError('filter must not be empty')
+    return where, params
+
+def validate_patch(fields):
+    if not isinstance(fields, dict) or not fields:
+        raise ValueError('set must be a non-empty object')
+    unknown = [f for f in fields if f not in MOTORCYCLE_FIELDS]
+    if unknown:
+        raise ValueError('Unknown field ' + ', '.join(unknown))
+    values = {}
+    for field, value in fields.items():
+        if value in (None, ''):
+            raise ValueError(f'{field} must not be empty')
+        if field in ('year', 'engine_cc'):
+            try:
+                values[field] = parse_int(value)
+            except (TypeError, ValueError):
+                raise ValueError('Year and Engine must be integers')
+        else:
+            values[field] = str(value)
+    return values
+
+def bulk_write(where, params, write_sql, write_params):
+    # write_sql is completed with "<id list>)"; returns (affected rows, error or None)
+    chunk_size = app.config['BULK_WRITE_CHUNK_SIZE']
+    select_sql = "SELECT id FROM motorcycles WHERE " + " AND ".join(where) + " AND id > %s ORDER BY id LIMIT %s"
+    affected, written, last_id = 0, [], 0
+    cur = mysql.connection.cursor()
+    try:
+        while True:
+            # Bump first: its row lock keeps other writers out until this chunk commits
+            bump_table_version(cur)
+            cur.execute(select_sql, params + [last_id, chunk_size])
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                mysql.connection.rollback()  # nothing (more) to write; leave the version alone
+                return affected, None
+            cur.execute(write_sql + ", ".join(["%s"] * len(ids)) + ")", write_params + ids)
+            affected += cur.rowcount
+            mysql.connection.commit()
+            written += ids
+            if len(ids) < chunk_size:
+                return affected, None
+            last_id = ids[-1]
+    except Exception as e:
+        mysql.connection.rollback()
+        return affected, str(e)
+    finally:
+        cur.close()
+        if written:
+            for id in written:
+                cache.delete(f'motorcycle:{id}')
+            invalidate_motorcycle()
+            snapshot_invalidate()
+            changes.notify()
+
+def bulk_count(where, params):
+    cur = mysql.connection.cursor()
+    cur.execute("SELECT COUNT(*) FROM motorcycles WHERE " + " AND ".join(where), params)
+    count = cur.fetchone()[0]
+    cur.close()
+    return count
+
+@app.route('/motorcycles/bulk', methods=['PATCH', 'DELETE'])
+@token_required
+def bulk_write_motorcycles():
+    fmt = request.args.get('format', 'json')
+    err_fmt = 'xml' if fmt == 'xml' else 'json'
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return format_response({'error': 'Body must be a JSON object'}, err_fmt), 400
+    try:
+        where, params = bulk_target(body)
+        if request.method == 'PATCH':
+            values = validate_patch(body.get('set'))
+    except ValueError as e:
+        return format_response({'error': str(e)}, err_fmt), 400
+
+    if dry_run:
+        return format_response({'matched': bulk_count(where, params), 'dry_run': True}, fmt)
+
+    if request.method == 'PATCH':
+        assignments = ", ".join(f"{field} = %s" for field in values)
+        write_sql = f"UPDATE motorcycles SET {assignments}, version = version + 1 WHERE id IN ("
+        write_params = list(values.values())
+    else:
+        write_sql, write_params = "DELETE FROM motorcycles WHERE id IN (", []
+    affected, error = bulk_write(where, params, write_sql, write_params)
+    result = {'affected': affected, 'dry_run': False}
+    if error:
+        # Chunks committed before the failure stay applied
+        result['error'] = error
+        return format_response(result, err_fmt), 400
+    return format_response(result, fmt)
+
 # === LIST MOTORCYCLES ===
 @app.route('/motorcycles', methods=['GET'])
 @token_required
+@replica_reads
 def list_motorcycles():
     search = request.args.get('search', '')
     fmt = request.args.get('format', 'html')
 
-    cur = mysql.connection.cursor()
-    if search:
-        cur.execute("SELECT * FROM motorcycles WHERE make LIKE %s OR model LIKE %s OR color LIKE %s",
-                    (f"%{search}%", f"%{search}%", f"%{search}%"))
+    # Answer revalidations from the table-wide counter before any real work
+    table_version, table_updated = motorcycles_table_version()
+    etag = resource_etag('list', table_version)
+    if is_not_modified(etag, table_updated):
+        return not_modified_response(etag, table_updated)
+
+    if 'ids' in request.args:
+        try:
+            ids = parse_ids([v for v in request.args['ids'].split(',') if v.strip()])
+        except ValueError as e:
+            return format_response({'error': str(e)}, fmt if fmt == 'xml' else 'json'), 400
+        return set_validators(multi_get_response(ids, fmt), etag, table_updated)
+
+    limit, after = get_page_args(request.args)
+    try:
+        query = list_query(request.args, limit, after)
+    except ValueError as e:
+        if fmt in ['json', 'xml']:
+            return format_response({'error': str(e)}, fmt), 400
+        return f'<h3 style="color:#f44336;">Error: {escape(str(e))}</h3><a href="/motorcycles" style="color:#4CAF50;">Back</a>', 400
+    sql, params = query['sql'], query['params']
+    page_sql, page_params = query['page_sql'], query['page_params']
+
+    # ?explain=1 (debug only) shows the plan MySQL picks for this page's query
+    if request.args.get('explain') == '1' and (app.debug or app.config['EXPLAIN_QUERIES']):
+        return format_response({'sql': page_sql, 'params': page_params, 'plan': explain(page_sql, page_params)},
+                               fmt if fmt == 'xml' else 'json')
+
+    # ?format=ndjson always streams; json/xml stream the whole result with ?stream=1
+    if fmt == 'ndjson' or (fmt in ['json', 'xml'] and request.args.get('stream') == '1'):
+        cur = mysql.read_connection.cursor(SSCursor)
+        cur.execute(sql, params)
+        return set_validators(Response(stream_with_context(stream_motorcycles(cur, fmt)),
+                                       mimetype=STREAM_MIMETYPES[fmt]), etag, table_updated)
+
+    key = list_cache_key(hashlib.sha1(repr((page_sql, page_params)).encode()).hexdigest())
+    cached = cache.get(key)
+    if cached is None:
+        cur = mysql.read_connection.cursor()
+        cur.execute(page_sql, page_params)
+        motorcycles, has_more = fetch_page(cur, limit)
+        cur.close()
+        cache.set(key, {'motorcycles': motorcycles, 'has_more': has_more})
     else:
-        cur.execute("SELECT * FROM motorcycles")
-    rows = cur.fetchall()
-    cur.close()
+        motorcycles, has_more = cached['motorcycles'], cached['has_more']
 
-    motorcycles = []
-    for row in rows:
-        motorcycles.append({
-            'id': row[0],
-            'make': row[1],
-            'model': row[2],
-            'year': row[3],
-            'engine_cc': row[4],
-            'color': row[5]
-        })
+    next_url = None
+    if has_more:
+        next_url = url_for('list_motorcycles', **next_page_args(request.args, limit, query, motorcycles[-1]))
 
     if fmt in ['json', 'xml']:
-        return format_response(motorcycles, fmt)
-
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>🏍️ Motorcycle Hub</title>
-        <style>
-            body { font-family: 'Segoe UI', sans-serif; background: #121212; color: #e0e0e0; padding: 20px; }
-            .container {
-                max-width: 900px; margin: auto; background: #1e1e1e;
-                padding: 25px; border-radius: 12px; box-shadow: 0 0 25px rgba(0,0,0,0.5);
-                border: 1px solid #333;
-            }
-            h2 { color: #4CAF50; margin-bottom: 20px; }
-            .controls { text-align: center; margin: 15px 0; }
-            .controls a { margin: 0 10px; color: #4CAF50; text-decoration: none; }
-            .controls a:hover { text-decoration: underline; }
-            form { text-align: center; margin: 20px 0; }
-            input[type="text"] {
-                padding: 10px; width: 300px; border: 1px solid #444;
-                border-radius: 6px; background: #2a2a2a; color: #fff;
-            }
-            button {
-                padding: 10px 20px; background: #4CAF50; color: white;
-                border: none; border-radius: 6px; cursor: pointer;
-            }
-            ul { list-style: none; padding: 0; }
-            li {
-                padding: 15px; margin: 12px 0; background: #252525;
-                border-left: 4px solid #4CAF50; border-radius: 6px;
-            }
-            .actions a {
-                margin-right: 12px; color: #4CAF50; text-decoration: none;
-                font-weight: bold;
-            }
-            .actions a:hover { text-decoration: underline; }
-            .nav { margin-top: 25px; text-align: center; }
-            .nav a {
-                margin: 0 10px; color: #4CAF50; text-decoration: none;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h2>🏍️ Motorcycle Inventory</h2>
-            <div class="controls">
-                <a href="/motorcycles?format=json">[JSON]</a>
-                <a href="/motorcycles?format=xml">[XML]</a>
-            </div>
-            <form method="GET">
-                <input type="text" name="search" placeholder="Search by make, model, or color..." value="{{search}}">
-                <button type="submit">Search</button>
-            </form>
-            <p><a href="/motorcycles/new" style="color:#4CAF50;">➕ Add New Motorcycle</a></p>
-            <ul>
-            {% for m in motorcycles %}
-                <li>
-                    <strong>{{m.make}} {{m.model}}</strong><br>
-                    <em>{{m.year}} • {{m.engine_cc}}cc • {{m.color}}</em><br>
-                    <div class="actions">
-                        <a href="/motorcycles/{{m.id}}">View</a>
-                        <a href="/motorcycles/{{m.id}}?format=json">JSON</a>
-                        <a href="/motorcycles/{{m.id}}?format=xml">XML</a>
-                        <a href="/motorcycles/{{m.id}}/edit">Edit</a>
-                        <a href="/motorcycles/{{m.id}}/delete" onclick="return confirm('Remove this motorcycle?')">Delete</a>
-                    </div>
-                </li>
-            {% endfor %}
-            </ul>
-            <div class="nav">
-                <a href="/">Home</a> | <a href="/logout">Logout</a>
-            </div>
-        </div>
-    </body>
-    </html>
-    ''', motorcycles=motorcycles, search=search)
+        resp = format_response(motorcycles, fmt)
+        if next_url:
+            resp.headers['Link'] = f'<{next_url}>; rel="next"'
+        return set_validators(resp, etag, table_updated)
+
+    return set_validators(render_template('list.html', motorcycles=motorcycles, search=search, next_url=next_url),
+                          etag, table_updated)
+
+# === INVENTORY STATS ===
+# GET /motorcycles/stats aggregates in MySQL with GROUP BY and honours the same
+# filters and ?search= as the list. Results are cached until the next write.
+def compute_stats(where, params, bucket):
+    sql_where = " WHERE " + " AND ".join(where) if where else ""
+    cur = mysql.connection.cursor()
+    cur.execute("SELECT COUNT(*), MIN(engine_cc), MAX(engine_cc), AVG(engine_cc) FROM motorcycles" + sql_where, params)
+    total, cc_min, cc_max, cc_avg = cur.fetchone()
+    stats = {
+        'total': total,
+        'engine_cc': {
+            'min': cc_min,
+            'max': cc_max,
+            'avg': round(float(cc_avg), 1) if cc_avg is not None else None,
+        },
+    }
+    for column in ('make', 'year', 'color'):
+        cur.execute(f"SELECT {column}, COUNT(*) AS n FROM motorcycles{sql_where} "
+                    f"GROUP BY {column} ORDER BY n DESC, {column}", params)
+        stats['by_' + column] = [{'value': value, 'count': n} for value, n in cur.fetchall()]
+    cur.execute(f"SELECT FLOOR(engine_cc / %s) AS bucket, COUNT(*) FROM motorcycles{sql_where} "
+                f"GROUP BY bucket ORDER BY bucket", [bucket] + params)
+    stats['engine_cc_histogram'] = [
+        {'from': int(b) * bucket, 'to': int(b) * bucket + bucket - 1, 'count': n}
+        for b, n in cur.fetchall()
+    ]
+    stats['bucket_width'] = bucket
+    cur.close()
+    return stats
+
+@app.route('/motorcycles/stats', methods=['GET'])
+@token_required
+def motorcycle_stats():
+    fmt = request.args.get('format', 'json')
+    search = request.args.get('search', '')
+    try:
+        where, params = build_filters(request.args)
+    except ValueError as e:
+        return format_response({'error': str(e)}, fmt), 400
+    try:
+        bucket = int(request.args.get('bucket', app.config['STATS_CC_BUCKET']))
+    except ValueError:
+        bucket = 0
+    if bucket < 1:
+        return format_response({'error': 'bucket must be a positive integer'}, fmt), 400
+    if search:
+        cond, cond_params = search_condition(search)
+        where.append(cond)
+        params += cond_params
+
+    key = list_cache_key('stats', hashlib.sha1(repr((where, params, bucket)).encode()).hexdigest())
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_stats(where, params, bucket)
+        cache.set(key, stats)
+    return format_response(stats, fmt)
+
+# === SNAPSHOT ANALYTICS ===
+# GET /motorcycles/snapshot?group_by=make&year_min=2021 ... answered from the
+# in-memory column store instead of MySQL.
+SNAPSHOT_GROUP_COLUMNS = ('make', 'model', 'color', 'year', 'engine_cc')
+
+@app.route('/motorcycles/snapshot', methods=['GET'])
+@token_required
+def snapshot_analytics():
+    fmt = request.args.get('format', 'json')
+    if snapshot is None:
+        return format_response({'error': 'Snapshot disabled'}, fmt), 404
+    filters = {name: request.args[name] for name in ('make', 'color') if request.args.get(name)}
+    try:
+        for name in RANGE_FILTERS:
+            if request.args.get(name, '') != '':
+                filters[name] = int(request.args[name])
+    except ValueError:
+        return format_response({'error': 'Range filters must be integers'}, fmt), 400
+    group_by = request.args.get('group_by')
+    if group_by and group_by not in SNAPSHOT_GROUP_COLUMNS:
+        return format_response({'error': 'group_by must be one of ' + ', '.join(SNAPSHOT_GROUP_COLUMNS)}, fmt), 400
+
+    snap = current_snapshot()
+    start = time.perf_counter()
+    result = {'count': snap.count(**filters)}
+    if group_by:
+        result['groups'] = snap.group_by(group_by, **filters)
+    result['elapsed_us'] = round((time.perf_counter() - start) * 1e6, 1)
+    result['memory'] = snap.memory()
+    return format_response(result, fmt)
+
+# === CHANGES ===
+# GET /motorcycles/changes?since=<seq> returns up to ?limit= changes after seq,
+# long-polling up to ?wait= seconds when there are none yet; pass the returned
+# 'next' as the following since. With Accept: text/event-stream (or
+# ?format=sse) the same feed is sent as Server-Sent Events, resumable through
+# Last-Event-ID.
+def sse_changes(since, limit):
+    heartbeat = app.config['CHANGES_HEARTBEAT']
+    yield 'retry: 3000\n\n'
+    while True:
+        events = changes.wait(since, limit, heartbeat)
+        if not events:
+            yield ': keep-alive\n\n'
+            continue
+        yield ''.join(f"id: {e['seq']}\nevent: {e['op']}\ndata: {app.json.dumps(e)}\n\n" for e in events)
+        since = events[-1]['seq']
+
+@app.route('/motorcycles/changes', methods=['GET'])
+@token_required
+def motorcycle_changes():
+    fmt = request.args.get('format', 'json')
+    sse = fmt == 'sse' or request.accept_mimetypes.best == 'text/event-stream'
+    err_fmt = 'xml' if fmt == 'xml' else 'json'
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+        limit = int(request.args.get('limit', app.config['CHANGES_MAX_BATCH']))
+        wait = float(request.args.get('wait', app.config['CHANGES_LONG_POLL_TIMEOUT']))
+    except ValueError:
+        return format_response({'error': 'since, limit and wait must be numbers'}, err_fmt), 400
+    limit = max(1, min(limit, app.config['CHANGES_MAX_BATCH']))
+    wait = max(0.0, min(wait, app.config['CHANGES_LONG_POLL_TIMEOUT']))
+
+    if sse:
+        return Response(stream_with_context(sse_changes(since, limit)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    events = changes.wait(since, limit, wait)
+    return format_response({
+        'changes': events,
+        'next': events[-1]['seq'] if events else since,
+        'has_more': len(events) == limit,
+    }, fmt)
 
 # === VIEW MOTORCYCLE ===
 @app.route('/motorcycles/<int:id>', methods=['GET', 'POST', 'DELETE'])
 @token_required
+@replica_reads
 def motorcycle_detail(id):
     if request.method == 'POST' and 'delete' in request.form:
         request.method = 'DELETE'
 
     fmt = request.args.get('format', 'html')
-    cur = mysql.connection.cursor()
-    cur.execute("SELECT * FROM motorcycles WHERE id = %s", (id,))
-    row = cur.fetchone()
-    if not row:
-        cur.close()
+    entry = cached_motorcycle_entry(id)
+    if not entry:
         if fmt in ['json', 'xml']:
             return format_response({'error': 'Not found'}, fmt), 404
         else:
             return '<h3 style="color:#f44336;">Motorcycle not found</h3><a href="/motorcycles" style="color:#4CAF50;">Back</a>', 404
 
-    mc = {
-        'id': row[0],
-        'make': row[1],
-        'model': row[2],
-        'year': row[3],
-        'engine_cc': row[4],
-        'color': row[5]
-    }
+    mc = entry['motorcycle']
 
     if request.method == 'GET':
+        etag = resource_etag('mc', id, entry['version'])
+        if is_not_modified(etag, entry['updated_at']):
+            return not_modified_response(etag, entry['updated_at'])
         if fmt in ['json', 'xml']:
-            cur.close()
-            return format_response(mc, fmt)
+            resp = format_response(mc, fmt)
         else:
-            html = '''
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>🏍️ {{mc.make}} {{mc.model}}</title>
-                <style>
-                    body { font-family: 'Segoe UI', sans-serif; background: #121212; color: #e0e0e0; padding: 20px; }
-                    .container {
-                        max-width: 600px; margin: 40px auto; background: #1e1e1e;
-                        padding: 30px; border-radius: 12px; box-shadow: 0 0 25px rgba(0,0,0,0.5);
-                        border: 1px solid #333;
-                    }
-                    h2 { color: #4CAF50; margin-bottom: 20px; }
-                    p { margin: 10px 0; font-size: 16px; }
-                    strong { color: #4CAF50; }
-                    .btn {
-                        display: inline-block; padding: 10px 20px; margin: 5px;
-                        background: #4CAF50; color: white; text-decoration: none;
-                        border-radius: 6px;
-                    }
-                    .btn:hover { background: #45a049; }
-                    .delete-btn {
-                        background: #f44336;
-                    }
-                    .delete-btn:hover {
-                        background: #d32f2f;
-                    }
-                    form { display: inline; }
-                    button {
-                        padding: 10px 20px; background: #f44336; color: white;
-                        border: none; border-radius: 6px; cursor: pointer;
-                    }
-                    button:hover { background: #d32f2f; }
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <h2>🏍️ {{mc.make}} {{mc.model}}</h2>
-                    <p><strong>Year:</strong> {{mc.year}}</p>
-                    <p><strong>Engine:</strong> {{mc.engine_cc}}cc</p>
-                    <p><strong>Color:</strong> {{mc.color}}</p>
-                    <div>
-                        <a href="/motorcycles/{{mc.id}}/edit" class="btn">✏️ Edit</a>
-                        <form method="POST" onsubmit="return confirm('Delete this motorcycle?')" style="display:inline">
-                            <input type="hidden" name="delete" value="1">
-                            <button type="submit">🗑️ Delete</button>
-                        </form>
-                        <a href="/motorcycles" class="btn">← Back</a>
-                    </div>
-                </div>
-            </body>
-            </html>
-            '''
-            cur.close()
-            return render_template_string(html, mc=mc)
+            resp = render_template('detail.html', mc=mc)
+        return set_validators(resp, etag, entry['updated_at'])
 
     # Handle POST (Update)
     elif request.method == 'POST':
@@ -499,18 +1435,30 @@ def motorcycle_detail(id):
             except:
                 return '<h3 style="color:#f44336;">Error: Year and Engine must be integers</h3><a href="/motorcycles/{{id}}/edit" style="color:#4CAF50;">Try again</a>', 400
 
+            cur = mysql.connection.cursor()
+            bump_table_version(cur)
             cur.execute("""
-                UPDATE motorcycles SET make=%s, model=%s, year=%s, engine_cc=%s, color=%s WHERE id=%s
+                UPDATE motorcycles SET make=%s, model=%s, year=%s, engine_cc=%s, color=%s,
+                    version = version + 1 WHERE id=%s
             """, (data['make'], data['model'], year, cc, data['color'], id))
             mysql.connection.commit()
             cur.close()
+            invalidate_motorcycle(id)
+            snapshot_upsert({'id': id, 'make': data['make'], 'model': data['model'],
+                             'year': year, 'engine_cc': cc, 'color': data['color']})
+            changes.notify()
             return redirect(url_for('motorcycle_detail', id=id))
 
     # Handle DELETE
     if request.method == 'DELETE':
+        cur = mysql.connection.cursor()
+        bump_table_version(cur)
         cur.execute("DELETE FROM motorcycles WHERE id = %s", (id,))
         mysql.connection.commit()
         cur.close()
+        invalidate_motorcycle(id)
+        snapshot_delete(id)
+        changes.notify()
         if fmt in ['json', 'xml']:
             return format_response({'message': 'Deleted'}, fmt)
         else:
@@ -519,138 +1467,90 @@ def motorcycle_detail(id):
 # === EDIT FORM ===
 @app.route('/motorcycles/<int:id>/edit', methods=['GET', 'POST'])
 @token_required
+@replica_reads
 def edit_motorcycle(id):
     if request.method == 'GET':
-        cur = mysql.connection.cursor()
-        cur.execute("SELECT * FROM motorcycles WHERE id = %s", (id,))
-        row = cur.fetchone()
-        cur.close()
-        if not row:
+        mc = cached_motorcycle(id)
+        if not mc:
             return '<h3 style="color:#f44336;">Not found</h3><a href="/motorcycles" style="color:#4CAF50;">Back</a>', 404
-        mc = {
-            'id': row[0],
-            'make': row[1],
-            'model': row[2],
-            'year': row[3],
-            'engine_cc': row[4],
-            'color': row[5]
-        }
-        html = '''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Edit Motorcycle • Motorcycle Hub</title>
-            <style>
-                body { font-family: 'Segoe UI', sans-serif; background: #121212; color: #e0e0e0; padding: 20px; }
-                .container {
-                    max-width: 600px; margin: 40px auto; background: #1e1e1e;
-                    padding: 30px; border-radius: 12px; box-shadow: 0 0 25px rgba(0,0,0,0.5);
-                    border: 1px solid #333;
-                }
-                h2 {
-                    color: #4CAF50; margin-bottom: 20px;
-                    border-bottom: 1px solid #333; padding-bottom: 8px;
-                }
-                input {
-                    width: 100%; padding: 10px; margin: 12px 0;
-                    border: 1px solid #444; border-radius: 6px;
-                    background: #2a2a2a; color: #fff;
-                }
-                button {
-                    width: 100%; padding: 12px; background: #4CAF50;
-                    color: white; border: none; border-radius: 6px;
-                    font-size: 16px; cursor: pointer; margin-top: 15px;
-                }
-                button:hover { background: #45a049; }
-                a {
-                    display: inline-block; margin-top: 15px;
-                    color: #4CAF50; text-decoration: none;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h2>✏️ Edit Motorcycle</h2>
-                <form method="POST" action="/motorcycles/{{mc.id}}">
-                    <input name="make" value="{{mc.make}}" required>
-                    <input name="model" value="{{mc.model}}" required>
-                    <input name="year" type="number" value="{{mc.year}}" required>
-                    <input name="engine_cc" type="number" value="{{mc.engine_cc}}" required>
-                    <input name="color" value="{{mc.color}}" required>
-                    <button type="submit">Save Changes</button>
-                </form>
-                <a href="/motorcycles/{{mc.id}}">← Cancel</a>
-            </div>
-        </body>
-        </html>
-        '''
-        return render_template_string(html, mc=mc)
+        return render_template('edit.html', mc=mc)
+
+# === PASSWORD HASHING ===
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    resp = make_response('<h3 style="text-align:center;color:#f44336;">Server busy, please try again</h3><a href="/login" style="display:block;text-align:center;color:#4CAF50;">Back</a>', 503)
+    resp.headers['Retry-After'] = '1'
+    return resp
+
+# === DB POOL ===
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    fmt = request.args.get('format', 'html')
+    if fmt in ['json', 'xml']:
+        return format_response({'error': 'Database busy, try again'}, fmt), 503
+    return '<h3 style="color:#f44336;">Database busy, try again</h3><a href="/motorcycles" style="color:#4CAF50;">Back</a>', 503
+
+@app.route('/db/stats', methods=['GET'])
+@token_required
+def db_stats():
+    stats = mysql.stats()
+    if create_buffer is not None:
+        stats['create_buffer'] = create_buffer.stats()
+    return format_response(stats, request.args.get('format', 'json'))
+
+# ?n= statements (default 20) ordered by ?sort=total_ms|count|max_ms|rows
+@app.route('/db/queries', methods=['GET'])
+@token_required
+def db_queries():
+    fmt = request.args.get('format', 'json')
+    if mysql.profiler is None:
+        return format_response({'error': 'SQL profiling disabled'}, fmt), 404
+    sort = request.args.get('sort', 'total_ms')
+    if sort not in ('total_ms', 'count', 'max_ms', 'rows'):
+        return format_response({'error': 'sort must be one of total_ms, count, max_ms, rows'}, fmt), 400
+    try:
+        n = max(1, int(request.args.get('n', 20)))
+    except ValueError:
+        return format_response({'error': 'n must be an integer'}, fmt), 400
+    return format_response(mysql.profiler.top(n, sort), fmt)
+
+# === CACHE STATS ===
+@app.route('/cache/stats', methods=['GET'])
+@token_required
+def cache_stats():
+    stats = cache.stats()
+    stats['token_cache'] = token_cache.stats()
+    stats['revoked_tokens'] = revoked_tokens.stats()
+    stats['fragment_cache'] = fragment_cache.stats()
+    return format_response(stats, request.args.get('format', 'json'))
+
+# === METRICS ===
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if not app.config['METRICS_ENABLED']:
+        return 'Not found', 404
+    return Response(metrics.render() + admission.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admission/stats', methods=['GET'])
+@token_required
+def admission_stats():
+    return format_response(admission.stats(), request.args.get('format', 'json'))
+
+# === STARTUP ===
+if snapshot is not None:
+    try:
+        with app.app_context():
+            current_snapshot()
+    except Exception as e:
+        app.logger.warning('Inventory snapshot not loaded at startup (%s); it will load on first use', e)
 
 # === HOME ===
 @app.route('/')
 def index():
     if 'token' in session:
-        return '''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>🏍️ Motorcycle Hub</title>
-            <style>
-                body { font-family: 'Segoe UI', sans-serif; background: #121212; display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0; color: #e0e0e0; }
-                .box {
-                    text-align: center; background: #1e1e1e; padding: 40px;
-                    border-radius: 15px; box-shadow: 0 0 30px rgba(0,0,0,0.6);
-                    border: 1px solid #333; max-width: 500px;
-                }
-                h1 { color: #4CAF50; font-size: 2.2em; margin-bottom: 30px; }
-                .btn {
-                    display: block; width: 220px; margin: 12px auto;
-                    padding: 14px; background: #4CAF50; color: white;
-                    text-decoration: none; border-radius: 8px; font-size: 18px;
-                }
-                .btn:hover { background: #45a049; }
-            </style>
-        </head>
-        <body>
-            <div class="box">
-                <h1>🏍️ Welcome to Motorcycle Hub</h1>
-                <a href="/motorcycles" class="btn">Manage Motorcycles</a>
-                <a href="/logout" class="btn">Logout</a>
-            </div>
-        </body>
-        </html>
-        '''
+        return static_pages['index_member'].response(request)
     else:
-        return '''
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>🏍️ Motorcycle Hub</title>
-            <style>
-                body { font-family: 'Segoe UI', sans-serif; background: #121212; display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0; color: #e0e0e0; }
-                .box {
-                    text-align: center; background: #1e1e1e; padding: 40px;
-                    border-radius: 15px; box-shadow: 0 0 30px rgba(0,0,0,0.6);
-                    border: 1px solid #333; max-width: 500px;
-                }
-                h1 { color: #4CAF50; font-size: 2.2em; margin-bottom: 30px; }
-                .btn {
-                    display: block; width: 220px; margin: 12px auto;
-                    padding: 14px; background: #4CAF50; color: white;
-                    text-decoration: none; border-radius: 8px; font-size: 18px;
-                }
-                .btn:hover { background: #45a049; }
-            </style>
-        </head>
-        <body>
-            <div class="box">
-                <h1>🏍️ Motorcycle Management System</h1>
-                <a href="/login" class="btn">Login</a>
-                <a href="/register" class="btn">Register</a>
-            </div>
-        </body>
-        </html>
-        '''
+        return static_pages['index'].response(request)
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
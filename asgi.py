@@ -0,0 +1,501 @@
+import asyncio
+import datetime
+import hashlib
+from contextlib import asynccontextmanager
+from functools import wraps
+from urllib.parse import urlencode
+from xml.sax.saxutils import escape
+
+import aiomysql
+import jwt
+from quart import Quart, Response, g, redirect, request, session
+from quart.wrappers.response import DataBody
+
+from app import (
+    ENTRY_SELECT, STREAM_MIMETYPES, XML_DECLARATION, app as wsgi_app, cache, get_page_args, hasher,
+    invalidate_motorcycle, iter_xml, list_cache_key, list_query, next_page_args, parse_ids, revoke_token,
+    row_to_entry, row_to_motorcycle, snapshot_delete, snapshot_upsert, static_pages, verify_token,
+    xml_element, xml_pretty,
+)
+from compression import available_encodings, compress_bytes, pick_encoding
+from db_pool import PoolTimeout
+from passwords import HasherBusy
+
+# === ASYNC SERVING MODE ===
+# The same site and API served from one event loop instead of a thread per
+# request:
+#
+#     pip install quart aiomysql hypercorn
+#     hypercorn asgi:app
+#
+# Queries go through aiomysql, so a request waiting on MySQL costs a coroutine
+# rather than a thread. Filters, paging, caching, tokens, templates and the
+# XML/JSON writers are the ones from app.py; only the handlers are async.
+# Bulk import, stats, snapshot analytics, /cache/stats and conditional GETs
+# stay on the WSGI app. Password hashing still runs on the hasher's thread pool.
+app = Quart(__name__)
+app.config.from_mapping(wsgi_app.config)
+app.secret_key = wsgi_app.secret_key
+
+# === ASYNC CONNECTION POOL ===
+# One aiomysql pool per process, opened when the server starts. A connection is
+# checked out on first use in a request and rolled back and returned when the
+# app context tears down, like MySQLPool does for the WSGI app.
+class AsyncMySQLPool:
+    def __init__(self, app):
+        self.config = app.config
+        self.pool = None
+        self.timeouts = 0
+        app.before_serving(self.open)
+        app.after_serving(self.close)
+        app.teardown_appcontext(self.teardown)
+
+    async def open(self):
+        cfg = self.config
+        self.pool = await aiomysql.create_pool(
+            host=cfg.get('MYSQL_HOST', 'localhost'),
+            user=cfg.get('MYSQL_USER', 'root'),
+            password=cfg.get('MYSQL_PASSWORD', ''),
+            db=cfg.get('MYSQL_DB'),
+            port=cfg.get('MYSQL_PORT', 3306),
+            charset=cfg.get('MYSQL_CHARSET', 'utf8mb4'),
+            connect_timeout=cfg.get('MYSQL_CONNECT_TIMEOUT', 10),
+            minsize=cfg.get('MYSQL_POOL_MIN_SIZE', 1),
+            maxsize=cfg.get('MYSQL_ASYNC_POOL_MAX_SIZE', 50),
+            pool_recycle=cfg.get('MYSQL_POOL_RECYCLE', 3600),
+            autocommit=False,
+        )
+
+    async def close(self):
+        self.pool.close()
+        await self.pool.wait_closed()
+
+    async def acquire(self):
+        timeout = self.config.get('MYSQL_POOL_TIMEOUT', 5)
+        try:
+            return await asyncio.wait_for(self.pool.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolTimeout(f'No database connection free after {timeout}s')
+
+    async def release(self, conn):
+        try:
+            # Never hand an open transaction to the next request
+            await conn.rollback()
+        except Exception:
+            conn.close()
+        self.pool.release(conn)
+
+    async def connection(self):
+        conn = g.get('_aiomysql_conn')
+        if conn is None:
+            conn = g._aiomysql_conn = await self.acquire()
+        return conn
+
+    async def cursor(self, *args):
+        return (await self.connection()).cursor(*args)
+
+    @asynccontextmanager
+    async def checkout(self):
+        # A connection of its own for streamed bodies: Quart tears the app
+        # context down (releasing the request's connection) before the body runs
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    async def teardown(self, exception):
+        conn = g.pop('_aiomysql_conn', None)
+        if conn is not None:
+            await self.release(conn)
+
+    def stats(self):
+        return {
+            'size': self.pool.size,
+            'idle': self.pool.freesize,
+            'min_size': self.pool.minsize,
+            'max_size': self.pool.maxsize,
+            'timeouts': self.timeouts,
+        }
+
+mysql = AsyncMySQLPool(app)
+
+# === RESPONSES ===
+def format_response(data, fmt='json'):
+    if fmt.lower() == 'xml':
+        return Response(''.join(iter_xml(data, xml_pretty(request.args))), mimetype='application/xml')
+    return Response(wsgi_app.json.dumps(data) + '\n', mimetype='application/json')
+
+def render(name, **context):
+    # Shares the WSGI app's compiled templates and row fragment cache
+    return wsgi_app.jinja_env.get_template(name).render(**context)
+
+@app.after_request
+async def compress(response):
+    # Same rules as compression.compress_response; streamed bodies go out as is
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or not isinstance(response.response, DataBody)
+            or response.mimetype not in app.config['COMPRESS_MIMETYPES']):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = pick_encoding(request, available_encodings())
+    data = await response.get_data()
+    if encoding and len(data) >= app.config['COMPRESS_MIN_SIZE']:
+        response.set_data(compress_bytes(data, encoding, app.config['COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+# === JWT AUTH DECORATOR ===
+def token_required(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        token = request.headers.get('x-access-token') or session.get('token')
+        fmt = request.args.get('format')
+        if not token:
+            if fmt in ['json', 'xml', 'ndjson']:
+                return format_response({'message': 'Token is missing!'}, fmt), 401
+            return redirect('/login')
+
+        claims = verify_token(token)
+        if claims is None:
+            if fmt in ['json', 'xml', 'ndjson']:
+                return format_response({'message': 'Token is invalid!'}, fmt), 401
+            session.pop('token', None)
+            return redirect('/login')
+        g.token_claims = claims
+        g.current_user = claims.get('user')
+        return await f(*args, **kwargs)
+    return decorated
+
+# === READ-THROUGH CACHE ===
+async def cached_motorcycle_entry(id):
+    key = f'motorcycle:{id}'
+    entry = cache.get(key)
+    if entry is None:
+        cur = await mysql.cursor()
+        await cur.execute(ENTRY_SELECT + " WHERE id = %s", (id,))
+        row = await cur.fetchone()
+        await cur.close()
+        if not row:
+            return None
+        entry = row_to_entry(row)
+        cache.set(key, entry)
+    return entry
+
+async def cached_motorcycles(ids):
+    found, missing = {}, []
+    for id in dict.fromkeys(ids):
+        entry = cache.get(f'motorcycle:{id}')
+        if entry is None:
+            missing.append(id)
+        else:
+            found[id] = entry['motorcycle']
+    if missing:
+        cur = await mysql.cursor()
+        await cur.execute(ENTRY_SELECT + " WHERE id IN (" + ", ".join(["%s"] * len(missing)) + ")", missing)
+        for row in await cur.fetchall():
+            entry = row_to_entry(row)
+            cache.set(f'motorcycle:{row[0]}', entry)
+            found[row[0]] = entry['motorcycle']
+        await cur.close()
+    return found
+
+async def bump_table_version(cur):
+    await cur.execute("UPDATE table_versions SET version = version + 1 WHERE table_name = 'motorcycles'")
+
+# === REGISTER ===
+@app.route('/register', methods=['GET', 'POST'])
+async def register():
+    if request.method == 'GET':
+        return static_pages['register'].response(request)
+
+    form = await request.form
+    username = form.get('username')
+    password = form.get('password')
+    if not username or not password:
+        return '<h3 style="text-align:center;color:#f44336;">Error: Username and password required</h3><a href="/register" style="display:block;text-align:center;color:#4CAF50;">Try again</a>', 400
+
+    hashed = await asyncio.to_thread(hasher.hash, password)
+    conn = await mysql.connection()
+    cur = conn.cursor()
+    try:
+        await cur.execute("INSERT INTO users (username, password) VALUES (%s, %s)", (username, hashed))
+        await conn.commit()
+        await cur.close()
+        return '<h3 style="text-align:center;color:#4CAF50;">Registered successfully!</h3><a href="/login" style="display:block;text-align:center;color:#4CAF50;">Login now</a>'
+    except Exception as e:
+        await cur.close()
+        if "Duplicate entry" in str(e):
+            return '<h3 style="text-align:center;color:#f44336;">Username already exists</h3><a href="/register" style="display:block;text-align:center;color:#4CAF50;">Try again</a>', 400
+        return '<h3 style="text-align:center;color:#f44336;">Registration failed</h3><a href="/register" style="display:block;text-align:center;color:#4CAF50;">Try again</a>', 500
+
+# === LOGIN ===
+@app.route('/login', methods=['GET', 'POST'])
+async def login():
+    if request.method == 'GET':
+        return static_pages['login'].response(request)
+
+    form = await request.form
+    username = form.get('username')
+    password = form.get('password')
+
+    conn = await mysql.connection()
+    cur = conn.cursor()
+    await cur.execute("SELECT id, password FROM users WHERE username = %s", (username,))
+    user = await cur.fetchone()
+    # Always one KDF run, whether or not the user exists
+    if await asyncio.to_thread(hasher.verify, password or '', user[1] if user else None) and password:
+        if hasher.needs_rehash(user[1]):
+            hashed = await asyncio.to_thread(hasher.hash, password)
+            await cur.execute("UPDATE users SET password = %s WHERE id = %s", (hashed, user[0]))
+            await conn.commit()
+    else:
+        user = None
+    await cur.close()
+
+    if not user:
+        return '<h3 style="text-align:center;color:#f44336;">Invalid credentials</h3><a href="/login" style="display:block;text-align:center;color:#4CAF50;">Try again</a>', 401
+
+    token = jwt.encode({
+        'user': username,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
+    }, app.config['SECRET_KEY'], algorithm="HS256")
+    session['token'] = token
+    return redirect('/motorcycles')
+
+# === LOGOUT ===
+@app.route('/logout')
+async def logout():
+    token = session.pop('token', None) or request.headers.get('x-access-token')
+    if token:
+        revoke_token(token)
+    return redirect('/login')
+
+# === CREATE MOTORCYCLE ===
+@app.route('/motorcycles/new', methods=['GET', 'POST'])
+@token_required
+async def create_motorcycle():
+    if request.method == 'GET':
+        return render('create.html')
+
+    form = await request.form
+    data = {name: form.get(name, '') for name in ('make', 'model', 'year', 'engine_cc', 'color')}
+    try:
+        year = int(data['year']); cc = int(data['engine_cc'])
+    except ValueError:
+        return '<h3 style="color:#f44336;">Error: Year and Engine must be numbers</h3><a href="/motorcycles/new" style="color:#4CAF50;">Try again</a>', 400
+
+    conn = await mysql.connection()
+    cur = conn.cursor()
+    try:
+        await bump_table_version(cur)
+        await cur.execute("""
+            INSERT INTO motorcycles (make, model, year, engine_cc, color)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (data['make'], data['model'], year, cc, data['color']))
+        new_id = cur.lastrowid
+        await conn.commit()
+        await cur.close()
+        invalidate_motorcycle()
+        snapshot_upsert({'id': new_id, 'make': data['make'], 'model': data['model'],
+                         'year': year, 'engine_cc': cc, 'color': data['color']})
+        return redirect('/motorcycles')
+    except Exception as e:
+        await cur.close()
+        return f'<h3 style="color:#f44336;">Error: {escape(str(e))}</h3><a href="/motorcycles/new" style="color:#4CAF50;">Try again</a>', 400
+
+# === BATCHED MULTI-GET ===
+async def multi_get_response(ids, fmt):
+    found = await cached_motorcycles(ids)
+    results = [found.get(id) or {'id': id, 'error': 'Not found'} for id in ids]
+    if fmt == 'ndjson':
+        return Response(''.join(wsgi_app.json.dumps(r) + '\n' for r in results), mimetype='application/x-ndjson')
+    if fmt in ['json', 'xml']:
+        return format_response(results, fmt)
+    return render('list.html', motorcycles=[found[id] for id in ids if id in found], search='', next_url=None)
+
+@app.route('/motorcycles/batch', methods=['POST'])
+@token_required
+async def batch_get_motorcycles():
+    fmt = request.args.get('format', 'json')
+    body = await request.get_json(silent=True)
+    if isinstance(body, dict):
+        body = body.get('ids')
+    try:
+        ids = parse_ids(body)
+    except ValueError as e:
+        return format_response({'error': str(e)}, fmt if fmt == 'xml' else 'json'), 400
+    return await multi_get_response(ids, fmt)
+
+# === LIST MOTORCYCLES ===
+async def stream_motorcycles(sql, params, fmt, pretty):
+    # Runs after the request's app context is gone, so it reads through a
+    # connection of its own that is released when the body finishes
+    batch_size = app.config['STREAM_BATCH_SIZE']
+    nl = '\n' if pretty else ''
+    async with mysql.checkout() as conn:
+        cur = conn.cursor(aiomysql.SSCursor)
+        try:
+            await cur.execute(sql, params)
+            if fmt == 'json':
+                yield '['
+            elif fmt == 'xml':
+                yield XML_DECLARATION + nl + '<response>' + nl
+            first = True
+            while True:
+                rows = await cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                chunk = []
+                for row in rows:
+                    mc = row_to_motorcycle(row)
+                    if fmt == 'json':
+                        chunk.append(('' if first else ',') + wsgi_app.json.dumps(mc))
+                    elif fmt == 'xml':
+                        chunk.append(xml_element('motorcycle', mc, 1, pretty))
+                    else:
+                        chunk.append(wsgi_app.json.dumps(mc) + '\n')
+                    first = False
+                yield ''.join(chunk)
+            if fmt == 'json':
+                yield ']\n'
+            elif fmt == 'xml':
+                yield '</response>' + nl
+        finally:
+            await cur.close()
+
+@app.route('/motorcycles', methods=['GET'])
+@token_required
+async def list_motorcycles():
+    search = request.args.get('search', '')
+    fmt = request.args.get('format', 'html')
+
+    if 'ids' in request.args:
+        try:
+            ids = parse_ids([v for v in request.args['ids'].split(',') if v.strip()])
+        except ValueError as e:
+            return format_response({'error': str(e)}, fmt if fmt == 'xml' else 'json'), 400
+        return await multi_get_response(ids, fmt)
+
+    limit, after = get_page_args(request.args)
+    try:
+        query = list_query(request.args, limit, after)
+    except ValueError as e:
+        if fmt in ['json', 'xml']:
+            return format_response({'error': str(e)}, fmt), 400
+        return f'<h3 style="color:#f44336;">Error: {escape(str(e))}</h3><a href="/motorcycles" style="color:#4CAF50;">Back</a>', 400
+
+    if fmt == 'ndjson' or (fmt in ['json', 'xml'] and request.args.get('stream') == '1'):
+        return Response(stream_motorcycles(query['sql'], query['params'], fmt, xml_pretty(request.args)),
+                        mimetype=STREAM_MIMETYPES[fmt])
+
+    page_sql, page_params = query['page_sql'], query['page_params']
+    key = list_cache_key(hashlib.sha1(repr((page_sql, page_params)).encode()).hexdigest())
+    cached = cache.get(key)
+    if cached is None:
+        cur = await mysql.cursor()
+        await cur.execute(page_sql, page_params)
+        rows = await cur.fetchmany(limit + 1)
+        await cur.close()
+        motorcycles, has_more = [row_to_motorcycle(row) for row in rows[:limit]], len(rows) > limit
+        cache.set(key, {'motorcycles': motorcycles, 'has_more': has_more})
+    else:
+        motorcycles, has_more = cached['motorcycles'], cached['has_more']
+
+    next_url = None
+    if has_more:
+        next_url = '/motorcycles?' + urlencode(next_page_args(request.args, limit, query, motorcycles[-1]))
+
+    if fmt in ['json', 'xml']:
+        resp = format_response(motorcycles, fmt)
+        if next_url:
+            resp.headers['Link'] = f'<{next_url}>; rel="next"'
+        return resp
+    return render('list.html', motorcycles=motorcycles, search=search, next_url=next_url)
+
+# === VIEW MOTORCYCLE ===
+@app.route('/motorcycles/<int:id>', methods=['GET', 'POST', 'DELETE'])
+@token_required
+async def motorcycle_detail(id):
+    form = await request.form
+    method = 'DELETE' if request.method == 'POST' and 'delete' in form else request.method
+
+    fmt = request.args.get('format', 'html')
+    entry = await cached_motorcycle_entry(id)
+    if not entry:
+        if fmt in ['json', 'xml']:
+            return format_response({'error': 'Not found'}, fmt), 404
+        return '<h3 style="color:#f44336;">Motorcycle not found</h3><a href="/motorcycles" style="color:#4CAF50;">Back</a>', 404
+
+    if method == 'GET':
+        if fmt in ['json', 'xml']:
+            return format_response(entry['motorcycle'], fmt)
+        return render('detail.html', mc=entry['motorcycle'])
+
+    conn = await mysql.connection()
+    cur = conn.cursor()
+    if method == 'POST':
+        data = {name: form.get(name, '') for name in ('make', 'model', 'year', 'engine_cc', 'color')}
+        try:
+            year = int(data['year']); cc = int(data['engine_cc'])
+        except ValueError:
+            return f'<h3 style="color:#f44336;">Error: Year and Engine must be integers</h3><a href="/motorcycles/{id}/edit" style="color:#4CAF50;">Try again</a>', 400
+        await bump_table_version(cur)
+        await cur.execute("""
+            UPDATE motorcycles SET make=%s, model=%s, year=%s, engine_cc=%s, color=%s,
+                version = version + 1 WHERE id=%s
+        """, (data['make'], data['model'], year, cc, data['color'], id))
+        await conn.commit()
+        await cur.close()
+        invalidate_motorcycle(id)
+        snapshot_upsert({'id': id, 'make': data['make'], 'model': data['model'],
+                         'year': year, 'engine_cc': cc, 'color': data['color']})
+        return redirect(f'/motorcycles/{id}')
+
+    await bump_table_version(cur)
+    await cur.execute("DELETE FROM motorcycles WHERE id = %s", (id,))
+    await conn.commit()
+    await cur.close()
+    invalidate_motorcycle(id)
+    snapshot_delete(id)
+    if fmt in ['json', 'xml']:
+        return format_response({'message': 'Deleted'}, fmt)
+    return redirect('/motorcycles')
+
+# === EDIT FORM ===
+@app.route('/motorcycles/<int:id>/edit', methods=['GET'])
+@token_required
+async def edit_motorcycle(id):
+    entry = await cached_motorcycle_entry(id)
+    if not entry:
+        return '<h3 style="color:#f44336;">Not found</h3><a href="/motorcycles" style="color:#4CAF50;">Back</a>', 404
+    return render('edit.html', mc=entry['motorcycle'])
+
+# === ERRORS ===
+@app.errorhandler(HasherBusy)
+async def hasher_busy(e):
+    return '<h3 style="text-align:center;color:#f44336;">Server busy, please try again</h3><a href="/login" style="display:block;text-align:center;color:#4CAF50;">Back</a>', 503, {'Retry-After': '1'}
+
+@app.errorhandler(PoolTimeout)
+async def pool_timeout(e):
+    fmt = request.args.get('format', 'html')
+    if fmt in ['json', 'xml']:
+        return format_response({'error': 'Database busy, try again'}, fmt), 503
+    return '<h3 style="color:#f44336;">Database busy, try again</h3><a href="/motorcycles" style="color:#4CAF50;">Back</a>', 503
+
+@app.route('/db/stats', methods=['GET'])
+@token_required
+async def db_stats():
+    return format_response(mysql.stats(), request.args.get('format', 'json'))
+
+# === HOME ===
+@app.route('/')
+async def index():
+    if 'token' in session:
+        return static_pages['index_member'].response(request)
+    return static_pages['index'].response(request)
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,422 @@
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+import jwt
+import MySQLdb
+
+from app import app
+
+# === BENCHMARK SUITE ===
+# Seeds a scratch MySQL database (never the app's own) with a synthetic
+# inventory built from motorcycle.sql, then drives each route at a given
+# concurrency and reports throughput, latency percentiles and peak RSS as JSON:
+#
+#     python bench.py run --rows 1000,100000,1000000 --concurrency 1,16 --output base.json
+#     python bench.py run ... --output new.json
+#     python bench.py compare base.json new.json      # exit 1 on regression
+#
+# By default requests go through the WSGI app in this process (Flask test
+# client, so no HTTP server in the numbers). --url drives a running server
+# instead (app.py or asgi.py started against the same database and SECRET_KEY);
+# pass --server-pid to report that server's peak RSS. On Linux the peak is
+# reset before each scenario (peak_rss_scope "scenario"); elsewhere it is the
+# process-lifetime peak, seeding included (peak_rss_scope "process").
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'motorcycle.sql')
+SAMPLE_ROW = re.compile(r"\('([^']*)', '([^']*)', (\d+), (\d+), '([^']*)'\)")
+SEED_BATCH_SIZE = 5000
+DELETE_MAKE = 'BenchDelete'
+
+
+# --- seeding ---
+def connect(db=None):
+    kwargs = dict(
+        host=app.config.get('MYSQL_HOST', 'localhost'),
+        user=app.config.get('MYSQL_USER', 'root'),
+        passwd=app.config.get('MYSQL_PASSWORD', ''),
+        port=app.config.get('MYSQL_PORT', 3306),
+        charset=app.config.get('MYSQL_CHARSET', 'utf8mb4'),
+    )
+    if db:
+        kwargs['db'] = db
+    return MySQLdb.connect(**kwargs)
+
+
+def schema_statements(sql):
+    # Table DDL and the table_versions seed from motorcycle.sql; the database
+    # name and the sample inventory are left out.
+    sql = '\n'.join(line for line in sql.splitlines() if not line.lstrip().startswith('--'))
+    for stmt in sql.split(';'):
+        stmt = stmt.strip()
+        if stmt and not stmt.upper().startswith(('CREATE DATABASE', 'USE ', 'INSERT INTO MOTORCYCLES')):
+            yield stmt
+
+
+def sample_rows(sql):
+    return [(make, model, int(year), int(cc), color) for make, model, year, cc, color in SAMPLE_ROW.findall(sql)]
+
+
+def synthetic_rows(samples, count, seed=0):
+    # Same makes/models/colors as the sample data, spread over years and
+    # engine sizes so the filters and indexes see a realistic distribution.
+    rng = random.Random(seed)
+    colors = sorted({s[4] for s in samples})
+    for i in range(count):
+        make, model, _, cc, _ = samples[i % len(samples)]
+        yield (make, f'{model} {rng.randint(1, 50)}', rng.randint(1990, 2025),
+               max(50, cc + rng.randint(-20, 20) * 10), rng.choice(colors))
+
+
+def seed(db, rows, seed_value=0):
+    sql = open(SCHEMA_FILE).read()
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute(f"CREATE DATABASE IF NOT EXISTS `{db}`")
+    conn.select_db(db)
+    cur.execute("DROP TABLE IF EXISTS motorcycles, motorcycle_changes, table_versions, users")
+    # The change-log triggers are created after the bulk load: seeding doesn't
+    # pay for them and the log starts empty. Timed writes still go through them.
+    statements = list(schema_statements(sql))
+    triggers = [stmt for stmt in statements if stmt.upper().startswith('CREATE TRIGGER')]
+    for stmt in statements:
+        if stmt not in triggers:
+            cur.execute(stmt)
+    batch = []
+    insert = "INSERT INTO motorcycles (make, model, year, engine_cc, color) VALUES (%s, %s, %s, %s, %s)"
+    for row in synthetic_rows(sample_rows(sql), rows, seed_value):
+        batch.append(row)
+        if len(batch) == SEED_BATCH_SIZE:
+            cur.executemany(insert, batch)
+            batch = []
+    if batch:
+        cur.executemany(insert, batch)
+    for stmt in triggers:
+        cur.execute(stmt)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def add_delete_victims(db, count):
+    # Rows for the delete scenario, inserted outside the timed section
+    conn = connect(db)
+    cur = conn.cursor()
+    cur.executemany("INSERT INTO motorcycles (make, model, year, engine_cc, color) VALUES (%s, %s, %s, %s, %s)",
+                    [(DELETE_MAKE, 'Victim', 2000, 100, 'Black')] * count)
+    cur.execute("SELECT id FROM motorcycles WHERE make = %s ORDER BY id", (DELETE_MAKE,))
+    ids = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    conn.close()
+    return ids
+
+
+# --- drivers ---
+# --- peak RSS ---
+def reset_peak_rss(pid):
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux only)
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_peak_rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class InProcessDriver:
+    def __init__(self, token):
+        self.headers = {'x-access-token': token}
+        self.local = threading.local()
+
+    def request(self, method, path, form=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = app.test_client()
+        resp = client.open(path, method=method, data=form, headers=self.headers)
+        resp.get_data()
+        resp.close()
+        return resp.status_code
+
+    def reset_peak_rss(self):
+        return reset_peak_rss(os.getpid())
+
+    def peak_rss_kb(self):
+        peak = read_peak_rss_kb(os.getpid())
+        return peak if peak is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class HTTPDriver:
+    def __init__(self, token, url, server_pid=None):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.headers = {'x-access-token': token}
+        self.server_pid = server_pid
+        self.local = threading.local()
+
+    def request(self, method, path, form=None):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = dict(self.headers)
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            return resp.status
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self.local.conn = None
+            return 0
+
+    def reset_peak_rss(self):
+        return bool(self.server_pid) and reset_peak_rss(self.server_pid)
+
+    def peak_rss_kb(self):
+        return read_peak_rss_kb(self.server_pid) if self.server_pid else None
+
+
+# --- scenarios ---
+# Each one returns (method, path, form) for the next request.
+def motorcycle_form(rng, samples):
+    make, model, year, cc, color = rng.choice(samples)
+    return {'make': make, 'model': model, 'year': str(year), 'engine_cc': str(cc), 'color': color}
+
+
+def make_scenarios(rows, samples, victims):
+    makes = sorted({s[0] for s in samples})
+    words = sorted({w for s in samples for w in s[1].split() if len(w) >= 3})
+    return {
+        'list_json': lambda rng: ('GET', '/motorcycles?format=json', None),
+        'list_xml': lambda rng: ('GET', '/motorcycles?format=xml', None),
+        'list_html': lambda rng: ('GET', '/motorcycles', None),
+        'list_deep_json': lambda rng: ('GET', f'/motorcycles?format=json&after={rng.randint(1, rows)}', None),
+        'filter_json': lambda rng: ('GET', f'/motorcycles?format=json&make={rng.choice(makes)}'
+                                           f'&year_min={rng.randint(1990, 2025)}&sort=-year', None),
+        'search_json': lambda rng: ('GET', f'/motorcycles?format=json&search={rng.choice(words)}', None),
+        'detail_json': lambda rng: ('GET', f'/motorcycles/{rng.randint(1, rows)}?format=json', None),
+        'detail_xml': lambda rng: ('GET', f'/motorcycles/{rng.randint(1, rows)}?format=xml', None),
+        'create': lambda rng: ('POST', '/motorcycles/new', motorcycle_form(rng, samples)),
+        'update': lambda rng: ('POST', f'/motorcycles/{rng.randint(1, rows)}', motorcycle_form(rng, samples)),
+        'delete': lambda rng: ('DELETE', f'/motorcycles/{victims.pop()}?format=json', None),
+    }
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_scenario(driver, next_request, requests, concurrency, seed_value=0):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker(n):
+        rng = random.Random(seed_value * 1000 + n)
+        local_latencies, local_statuses = [], {}
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+                method, path, form = next_request(rng)
+            start = time.perf_counter()
+            status = driver.request(method, path, form)
+            local_latencies.append(time.perf_counter() - start)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, n in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + n
+
+    per_scenario = driver.reset_peak_rss()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': sum(n for status, n in statuses.items() if not 200 <= status < 400),
+        'statuses': {str(status): n for status, n in sorted(statuses.items())},
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 50)),
+            'p95': ms(percentile(latencies, 95)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+        'peak_rss_kb': driver.peak_rss_kb(),
+        'peak_rss_scope': 'scenario' if per_scenario else 'process',
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(SCHEMA_FILE), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    app.config['MYSQL_DB'] = args.db
+    # The benchmark is one client hammering the app on purpose; measure the app,
+    # not the rate limiter (start a --url server with ADMISSION_ENABLED = False too)
+    app.config['ADMISSION_ENABLED'] = False
+    token = jwt.encode({'user': 'bench', 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)},
+                       app.config['SECRET_KEY'], algorithm="HS256")
+    if args.url:
+        driver = HTTPDriver(token, args.url, args.server_pid)
+    else:
+        driver = InProcessDriver(token)
+    samples = sample_rows(open(SCHEMA_FILE).read())
+    names = args.scenarios.split(',') if args.scenarios else None
+
+    results = []
+    for rows in args.rows:
+        if not args.no_seed:
+            log(f'seeding {rows} rows into {args.db}')
+            seed(args.db, rows, args.seed)
+        for concurrency in args.concurrency:
+            victims = add_delete_victims(args.db, args.requests + args.warmup) if not names or 'delete' in names else []
+            scenarios = make_scenarios(rows, samples, victims)
+            for name, next_request in scenarios.items():
+                if names and name not in names:
+                    continue
+                if args.warmup:
+                    run_scenario(driver, next_request, args.warmup, concurrency, args.seed + 1)
+                result = run_scenario(driver, next_request, args.requests, concurrency, args.seed)
+                result.update(scenario=name, rows=rows, concurrency=concurrency)
+                results.append(result)
+                log(f"{name:<16} rows={rows:<8} c={concurrency:<4} {result['throughput_rps']:>9} rps  "
+                    f"p50={result['latency_ms']['p50']}ms p95={result['latency_ms']['p95']}ms "
+                    f"p99={result['latency_ms']['p99']}ms errors={result['errors']}")
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'target': args.url or 'in-process',
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(out + '\n')
+    else:
+        print(out)
+
+
+# --- regression check ---
+def compare(args):
+    base = {(r['scenario'], r['rows'], r['concurrency']): r for r in json.load(open(args.base))['results']}
+    regressions = 0
+    for r in json.load(open(args.new))['results']:
+        old = base.get((r['scenario'], r['rows'], r['concurrency']))
+        if old is None:
+            continue
+        checks = [
+            ('throughput_rps', old['throughput_rps'], r['throughput_rps'], False),
+            ('p95_ms', old['latency_ms']['p95'], r['latency_ms']['p95'], True),
+            ('p99_ms', old['latency_ms']['p99'], r['latency_ms']['p99'], True),
+        ]
+        for metric, before, after, higher_is_worse in checks:
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = change > args.threshold if higher_is_worse else change < -args.threshold
+            if worse:
+                regressions += 1
+            print(f"{'REGRESSION' if worse else 'ok':<10} {r['scenario']:<16} rows={r['rows']:<8} "
+                  f"c={r['concurrency']:<4} {metric:<15} {before} -> {after} ({change:+.1%})")
+    print(f'{regressions} regression(s) beyond {args.threshold:.0%}')
+    sys.exit(1 if regressions else 0)
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def int_list(text):
+    return [int(v) for v in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load and latency benchmarks for the motorcycle API')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('seed', help='create the benchmark database with N synthetic rows')
+    p.add_argument('--db', default='motorcycles_bench')
+    p.add_argument('--rows', type=int, default=1000)
+    p.add_argument('--seed', type=int, default=0)
+
+    p = sub.add_parser('run', help='seed and benchmark every scenario')
+    p.add_argument('--db', default='motorcycles_bench', help='scratch database (dropped and recreated)')
+    p.add_argument('--rows', type=int_list, default=[1000], help='inventory sizes, e.g. 1000,100000,1000000')
+    p.add_argument('--concurrency', type=int_list, default=[1, 16])
+    p.add_argument('--requests', type=int, default=1000, help='timed requests per scenario')
+    p.add_argument('--warmup', type=int, default=50, help='untimed requests per scenario')
+    p.add_argument('--scenarios', help='comma-separated subset to run')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--no-seed', action='store_true', help='reuse the database as it is')
+    p.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    p.add_argument('--server-pid', type=int, help='pid of the --url server, for its peak RSS')
+    p.add_argument('--output', help='write the JSON report here instead of stdout')
+
+    p = sub.add_parser('compare', help='compare two reports and fail on regressions')
+    p.add_argument('base')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=0.10, help='allowed relative change (0.10 = 10%%)')
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed(args.db, args.rows, args.seed)
+    elif args.command == 'run':
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    main()
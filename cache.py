@@ -0,0 +1,185 @@
+import heapq
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+# === IN-PROCESS LRU CACHE ===
+# Entries expire after their TTL and the least recently used one is evicted
+# once max_entries is reached. Counters (used for list-page generations) live
+# outside the LRU so they are never evicted.
+class LRUCache:
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self.data[key]
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def counter(self, key):
+        with self.lock:
+            return self.counters.get(key, 0)
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+            }
+
+
+# === EXPIRING SET ===
+# Keys kept until their own expiry time (a Unix timestamp) and never dropped
+# before it, for revocation lists where losing an entry early would let it back
+# in. Expired keys are swept off a heap whenever a new one is added.
+class ExpiringSet:
+    def __init__(self):
+        self.expires = {}
+        self.heap = []
+        self.lock = threading.Lock()
+
+    def add(self, key, expires):
+        with self.lock:
+            self.sweep(time.time())
+            if expires > self.expires.get(key, 0):
+                self.expires[key] = expires
+                heapq.heappush(self.heap, (expires, key))
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.expires.get(key, 0) > time.time()
+
+    def sweep(self, now):
+        while self.heap and self.heap[0][0] <= now:
+            expires, key = heapq.heappop(self.heap)
+            if self.expires.get(key) == expires:
+                del self.expires[key]
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.expires)}
+
+
+# === SHARED CACHE (REDIS) ===
+# Shared between app processes. Works with any client exposing the redis-py
+# get/set/delete/incr calls, so a local stand-in (e.g. fakeredis) can be
+# passed in for development and tests.
+class RedisCache:
+    def __init__(self, client, ttl=60, prefix='motorcycles:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        with self.lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'redis',
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'ttl': self.ttl,
+            }
+
+
+# === SHARED EXPIRING SET (REDIS) ===
+# ExpiringSet kept in Redis so every app process sees the same keys: one
+# Redis key per member, with EX set to its remaining lifetime.
+class RedisExpiringSet:
+    def __init__(self, client, prefix='motorcycles:expiring:'):
+        self.client = client
+        self.prefix = prefix
+
+    def add(self, key, expires):
+        ttl = math.ceil(expires - time.time())
+        if ttl > 0:
+            self.client.set(self.prefix + key, 1, ex=ttl)
+
+    def __contains__(self, key):
+        return bool(self.client.exists(self.prefix + key))
+
+    def stats(self):
+        return {'backend': 'redis'}
+
+
+def make_expiring_set(cache, name):
+    # Shared through Redis when the cache is; otherwise local to this process
+    if isinstance(cache, RedisCache):
+        return RedisExpiringSet(cache.client, prefix=f'{cache.prefix}{name}:')
+    return ExpiringSet()
+
+
+def make_cache(config):
+    if config.get('CACHE_BACKEND') == 'redis':
+        import redis
+        client = redis.Redis.from_url(config['CACHE_REDIS_URL'])
+        return RedisCache(client, ttl=config['CACHE_TTL'])
+    return LRUCache(max_entries=config['CACHE_MAX_ENTRIES'], ttl=config['CACHE_TTL'])
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+
+
+# === CHANGE FEED ===
+# Fans motorcycle_changes out to any number of long-poll / SSE subscribers in
+# this process. The newest buffer_size events are kept in memory; one thread at
+# a time tops the buffer up from the database (when notify() says a local
+# write committed, or every poll_interval seconds to pick up other processes),
+# and every waiting subscriber is served from that single read. Only clients
+# further behind than the buffer query the database themselves.
+#
+#   fetch(since, limit) -> events with seq > since, oldest first
+#   latest()            -> highest seq in the database
+class ChangeFeed:
+    def __init__(self, fetch, latest, buffer_size=10000, poll_interval=1.0):
+        self.fetch = fetch
+        self.latest = latest
+        self.buffer = deque(maxlen=buffer_size)
+        self.poll_interval = poll_interval
+        self.cond = threading.Condition()
+        self.head = None    # highest seq seen; None until the first refresh
+        self.floor = None   # the buffer holds every event with floor < seq <= head
+        self.dirty = True
+        self.refreshing = False
+        self.checked_at = 0.0
+        self.waiting = 0
+        self.refreshes = 0
+        self.buffer_reads = 0
+        self.db_reads = 0
+
+    def notify(self):
+        with self.cond:
+            self.dirty = True
+            self.cond.notify_all()
+
+    def refresh(self):
+        with self.cond:
+            due = self.dirty or time.monotonic() - self.checked_at >= self.poll_interval
+            if self.refreshing or not due:
+                return
+            self.refreshing = True
+            self.dirty = False
+            head = self.head
+        new = []
+        try:
+            if head is None:
+                head = self.latest()
+            else:
+                while True:
+                    batch = self.fetch(head, self.buffer.maxlen)
+                    new += batch
+                    if len(batch) < self.buffer.maxlen:
+                        break
+                    head = batch[-1]['seq']
+        finally:
+            with self.cond:
+                self.refreshing = False
+                self.checked_at = time.monotonic()
+                self.refreshes += 1
+                if self.head is None:
+                    self.head = self.floor = head
+                for event in new:
+                    if len(self.buffer) == self.buffer.maxlen:
+                        self.floor = self.buffer[0]['seq']
+                    self.buffer.append(event)
+                    self.head = event['seq']
+                self.cond.notify_all()
+
+    def read(self, since, limit):
+        with self.cond:
+            if self.floor is not None and since >= self.floor:
+                self.buffer_reads += 1
+                events = []
+                for event in self.buffer:
+                    if event['seq'] > since:
+                        events.append(event)
+                        if len(events) == limit:
+                            break
+                return events
+            self.db_reads += 1
+        return self.fetch(since, limit)
+
+    def wait(self, since, limit, timeout):
+        # Up to `limit` events after `since`, waiting up to `timeout` seconds
+        # for the first one to arrive
+        deadline = time.monotonic() + timeout
+        while True:
+            self.refresh()
+            events = self.read(since, limit)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            with self.cond:
+                self.waiting += 1
+                self.cond.wait(min(remaining, self.poll_interval))
+                self.waiting -= 1
+
+    def stats(self):
+        with self.cond:
+            return {
+                'head': self.head,
+                'buffered': len(self.buffer),
+                'buffer_size': self.buffer.maxlen,
+                'subscribers_waiting': self.waiting,
+                'refreshes': self.refreshes,
+                'buffer_reads': self.buffer_reads,
+                'db_reads': self.db_reads,
+            }
@@ -0,0 +1,100 @@
+import gzip
+import hashlib
+import zlib
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli else ['gzip']
+
+
+def pick_encoding(request, encodings):
+    # best_match prefers the earlier entry on equal quality, so br wins over gzip
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress_bytes(data, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def iter_compress(chunks, encoding, level=6):
+    # Each chunk is flushed as it comes so streamed responses still reach the
+    # client incrementally; the original iterable is always closed.
+    if encoding == 'br':
+        comp = brotli.Compressor(quality=min(level, 11))
+        process, flush, finish = comp.process, comp.flush, comp.finish
+    else:
+        comp = zlib.compressobj(level, zlib.DEFLATED, 31)
+        process, flush, finish = comp.compress, lambda: comp.flush(zlib.Z_SYNC_FLUSH), comp.flush
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+# === PRECOMPUTED STATIC PAGES ===
+# Rendered once at startup and stored with gzip/brotli variants and a strong
+# ETag per variant, so serving one is a dict lookup.
+class StaticPage:
+    def __init__(self, html, mimetype='text/html', vary_cookie=False):
+        body = html.encode('utf-8')
+        self.mimetype = mimetype
+        self.vary_cookie = vary_cookie
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {None: body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli:
+            self.variants['br'] = brotli.compress(body, quality=11)
+
+    def response(self, request):
+        encoding = pick_encoding(request, [e for e in available_encodings() if e in self.variants])
+        etag = self.etag + ('-' + encoding if encoding else '')
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+        else:
+            resp = Response(self.variants[encoding], mimetype=self.mimetype)
+            if encoding:
+                resp.headers['Content-Encoding'] = encoding
+        resp.set_etag(etag)
+        resp.vary.add('Accept-Encoding')
+        if self.vary_cookie:
+            resp.vary.add('Cookie')
+        return resp
+
+
+# === RESPONSE COMPRESSION ===
+def compress_response(response, request, config):
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.direct_passthrough
+            or response.mimetype not in config['COMPRESS_MIMETYPES']):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = pick_encoding(request, available_encodings())
+    if not encoding:
+        return response
+    level = config['COMPRESS_LEVEL']
+    if response.is_streamed:
+        response.response = iter_compress(response.response, encoding, level)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress_bytes(data, encoding, level))
+    response.headers['Content-Encoding'] = encoding
+    return response
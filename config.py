@@ -2,4 +2,138 @@ class Config:
     MYSQL_HOST = 'localhost'
     MYSQL_USER = 'root'          # ← change if needed
     MYSQL_PASSWORD = 'root'          # ← your MySQL password
-    MYSQL_DB = 'motorcycles_db'
\ No newline at end of file
+    MYSQL_DB = 'motorcycles_db'
+
+    # Connection pool (db_pool.MySQLPool)
+    MYSQL_POOL_MIN_SIZE = 2      # connections opened up front
+    MYSQL_POOL_MAX_SIZE = 10     # hard limit on open connections
+    MYSQL_POOL_RECYCLE = 3600    # reopen connections older than this (seconds)
+    MYSQL_POOL_TIMEOUT = 5       # max wait for a free connection before 503 (seconds)
+    MYSQL_POOL_PING = True       # ping idle connections before handing them out
+
+    # Read replicas: GETs of the list, detail and edit pages are served from
+    # these when set. Each entry overrides the MYSQL_* settings above, e.g.
+    # [{'host': '127.0.0.1', 'port': 3307, 'connect_timeout': 2}] for a second
+    # local mysqld (replicating from the primary, or just loaded from
+    # motorcycle.sql to try it out). Empty = everything on the primary.
+    MYSQL_REPLICAS = []
+    MYSQL_REPLICA_POOL_MAX_SIZE = 10
+    MYSQL_REPLICA_POOL_TIMEOUT = 0.1   # wait for a free replica connection before using the primary (seconds)
+    MYSQL_REPLICA_RETRY_AFTER = 5      # a replica that failed its health check is skipped this long (seconds)
+    READ_YOUR_WRITES_WINDOW = 5        # a client reads from the primary this long after writing (seconds)
+
+    # Pagination for GET /motorcycles
+    MOTORCYCLES_PAGE_SIZE = 50       # rows per page when ?limit is not given
+    MOTORCYCLES_MAX_PAGE_SIZE = 200  # hard cap, larger ?limit values are clamped
+
+    # Rows fetched per round trip when streaming exports (?format=ndjson, ?stream=1)
+    STREAM_BATCH_SIZE = 500
+
+    # XML responses are indented by default; ?pretty=0 switches to compact output
+    XML_PRETTY_PRINT = True
+
+    # Search terms shorter than this use the LIKE fallback instead of the
+    # FULLTEXT index; keep it equal to the MySQL server's ngram_token_size
+    SEARCH_MIN_TERM_LENGTH = 2
+
+    # Read-through cache for motorcycle rows and list/search pages.
+    # 'memory' is a per-process LRU; 'redis' shares it between processes.
+    CACHE_BACKEND = 'memory'
+    CACHE_TTL = 60                 # seconds
+    CACHE_MAX_ENTRIES = 10000      # memory backend only
+    CACHE_REDIS_URL = 'redis://localhost:6379/0'
+
+    # Verified JWTs remembered by token_required (revoked ones are kept until they expire, uncapped)
+    TOKEN_CACHE_MAX_ENTRIES = 10000
+
+    # Password hashing (passwords.PasswordHasher). Changing the KDF or its cost
+    # re-hashes each user's password on their next successful login.
+    PASSWORD_KDF = 'pbkdf2_sha256'        # or 'scrypt'
+    PASSWORD_PBKDF2_ITERATIONS = 600000
+    PASSWORD_SCRYPT_N = 2 ** 14
+    PASSWORD_SCRYPT_R = 8
+    PASSWORD_SCRYPT_P = 1
+    PASSWORD_HASH_WORKERS = 4             # hashing threads
+    PASSWORD_HASH_QUEUE = 32              # requests allowed to wait for a worker
+    PASSWORD_HASH_TIMEOUT = 10            # seconds to wait for a slot before 503
+
+    # POST /motorcycles/bulk
+    BULK_BATCH_SIZE = 1000     # rows per executemany + commit
+    BULK_MAX_ERRORS = 1000     # per-row errors listed in the response
+
+    # Group commit for POST /motorcycles/new: queue single creates and write them
+    # as one multi-row INSERT + commit per batch (group_commit.GroupCommitter)
+    CREATE_GROUP_COMMIT = False
+    CREATE_BATCH_SIZE = 100        # flush once this many rows are queued (and admit that many at once)...
+    CREATE_BATCH_DELAY_MS = 5      # ...or the oldest has waited this long
+    CREATE_QUEUE_SIZE = 1000       # rows queued before callers wait (backpressure)
+    CREATE_QUEUE_TIMEOUT = 1.0     # seconds a caller waits for room before 503
+
+    # PATCH/DELETE /motorcycles/bulk
+    BULK_WRITE_CHUNK_SIZE = 500    # rows per set-based UPDATE/DELETE + commit
+    BULK_WRITE_MAX_IDS = 10000     # longest explicit "ids" list accepted
+
+    # Templates (templates/): compile all of them at startup, and cache the
+    # rendered <li> fragment of each inventory row
+    TEMPLATES_WARM = True
+    FRAGMENT_CACHE_MAX_ENTRIES = 5000
+    FRAGMENT_CACHE_TTL = 3600
+
+    # Response compression (gzip, plus brotli when the package is installed)
+    COMPRESS_MIN_SIZE = 1024   # bytes; smaller bodies are sent as-is
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIMETYPES = ['text/html', 'application/json', 'application/xml', 'application/x-ndjson']
+
+    # Allow ?explain=1 on GET /motorcycles outside debug mode
+    EXPLAIN_QUERIES = False
+
+    # In-memory columnar snapshot for GET /motorcycles/snapshot analytics
+    SNAPSHOT_ENABLED = False
+    SNAPSHOT_MAX_AGE = 300     # seconds before a full reload; 0 = only local incremental updates
+
+    # Default engine_cc histogram bucket width for GET /motorcycles/stats (?bucket=)
+    STATS_CC_BUCKET = 100
+
+    # Largest id list accepted by GET /motorcycles?ids= and POST /motorcycles/batch
+    MULTIGET_MAX_IDS = 100
+
+    # Request metrics: GET /metrics (Prometheus text format) and, when debug or
+    # SERVER_TIMING is on, a Server-Timing header with the per-phase breakdown
+    METRICS_ENABLED = True
+    METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    SERVER_TIMING = False
+
+    # SQL profiling (sql_profile.SQLProfiler, report at GET /db/queries)
+    SQL_PROFILE_ENABLED = True
+    SQL_SLOW_QUERY_MS = 200             # log statements at least this slow
+    SQL_SLOW_QUERY_LOG = None           # file for the slow-query log; None = app logger
+    SQL_PROFILE_MAX_FINGERPRINTS = 1000 # distinct statements tracked, the rest go to '<other>'
+    SQL_N_PLUS_ONE_THRESHOLD = 10       # same statement this often in one request = likely N+1
+
+    # Change feed (GET /motorcycles/changes)
+    CHANGES_BUFFER_SIZE = 10000      # newest events kept in memory for subscribers
+    CHANGES_POLL_INTERVAL = 1.0      # seconds between checks for writes from other processes
+    CHANGES_LONG_POLL_TIMEOUT = 25   # longest ?wait= a long-poll may block (seconds)
+    CHANGES_MAX_BATCH = 500          # most events per response / SSE message batch
+    CHANGES_HEARTBEAT = 15           # SSE keep-alive comment interval (seconds)
+
+    # Admission control in front of the DB-backed routes (the authenticated ones
+    # plus login/register): token buckets per client address and per JWT user
+    # (429 when empty), and a cap on in-flight requests per route (503 after
+    # ADMISSION_MAX_WAIT).
+    # Rates are requests/second; 0 turns a limit off.
+    ADMISSION_ENABLED = True
+    ADMISSION_IP_RATE = 50
+    ADMISSION_IP_BURST = 100
+    ADMISSION_USER_RATE = 20
+    ADMISSION_USER_BURST = 40
+    ADMISSION_MAX_KEYS = 100000     # token buckets kept in memory (LRU)
+    ADMISSION_CONCURRENCY = 8       # default in-flight cap per route; keep below MYSQL_POOL_MAX_SIZE
+    ADMISSION_ROUTE_CONCURRENCY = {
+        '/motorcycles/stats': 2,
+        '/motorcycles/snapshot': 2,
+        '/motorcycles/changes': 0,  # long-polls wait without holding a connection
+        '/login': 4,                # each POST runs the password KDF; match PASSWORD_HASH_WORKERS
+        '/register': 4,
+    }
+    ADMISSION_MAX_WAIT = 0.25       # seconds a request may queue for a slot before 503
@@ -0,0 +1,373 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import MySQLdb
+from flask import g
+
+from metrics import add_phase_time, timed
+from sql_profile import SQLProfiler
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# === CONNECTION POOL ===
+# Keeps up to max_size MySQL connections open and hands them out per request.
+# Idle connections are reused most-recently-used first, pinged before use when
+# health checks are on, and reopened once they are older than `recycle` seconds.
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=10, recycle=3600, timeout=5, ping=True):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.recycle = recycle
+        self.timeout = timeout
+        self.ping = ping
+        self.idle = deque()
+        self.born = {}
+        self.size = 0
+        self.cond = threading.Condition()
+        self.in_use = 0
+        self.created = 0
+        self.recycled = 0
+        self.health_check_failures = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+
+    def open_connection(self):
+        conn = self.connect()
+        with self.cond:
+            self.born[conn] = time.monotonic()
+            self.created += 1
+        return conn
+
+    def close_connection(self, conn):
+        with self.cond:
+            self.born.pop(conn, None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def warm(self):
+        while True:
+            with self.cond:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            try:
+                conn = self.open_connection()
+            except Exception:
+                with self.cond:
+                    self.size -= 1
+                raise
+            with self.cond:
+                self.idle.append(conn)
+                self.cond.notify()
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = None
+        with self.cond:
+            while True:
+                if self.idle:
+                    conn = self.idle.pop()
+                    break
+                if self.size < self.max_size:
+                    self.size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(f'No database connection free after {self.timeout}s')
+                self.cond.wait(remaining)
+            waited = time.monotonic() - start
+            if waited > 0.001:
+                self.waits += 1
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.in_use += 1
+
+        try:
+            if conn is not None and time.monotonic() - self.born.get(conn, 0) > self.recycle:
+                self.recycled += 1
+                self.close_connection(conn)
+                conn = None
+            if conn is not None and self.ping:
+                try:
+                    conn.ping()
+                except Exception:
+                    self.health_check_failures += 1
+                    self.close_connection(conn)
+                    conn = None
+            if conn is None:
+                conn = self.open_connection()
+        except Exception:
+            with self.cond:
+                self.size -= 1
+                self.in_use -= 1
+                self.cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard:
+            try:
+                # Never hand an open transaction to the next request
+                conn.rollback()
+            except Exception:
+                discard = True
+        if discard:
+            self.close_connection(conn)
+        with self.cond:
+            self.in_use -= 1
+            if discard:
+                self.size -= 1
+            else:
+                self.idle.append(conn)
+            self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'idle': len(self.idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'created': self.created,
+                'recycled': self.recycled,
+                'health_check_failures': self.health_check_failures,
+                'waits': self.waits,
+                'wait_time_total': round(self.wait_time, 6),
+                'wait_time_max': round(self.max_wait, 6),
+                'timeouts': self.timeouts,
+            }
+
+
+# === TIMED CONNECTIONS ===
+# Thin proxies handed out by MySQLPool: time spent in execute/fetch/commit
+# counts towards the request's 'query' phase, and every statement is reported
+# to the SQL profiler when one is set. Everything else passes through.
+class TimedCursor:
+    def __init__(self, cursor, profiler=None):
+        self.cursor = cursor
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def run(self, method, query, args):
+        start = time.perf_counter()
+        try:
+            return method(query, args)
+        finally:
+            elapsed = time.perf_counter() - start
+            add_phase_time('query', elapsed)
+            if self.profiler is not None:
+                rows = self.cursor.rowcount
+                # Unbuffered cursors don't know their row count up front
+                self.profiler.record(query, args, elapsed, rows if 0 <= rows < 2 ** 63 else None)
+
+    def execute(self, query, args=None):
+        return self.run(self.cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self.run(self.cursor.executemany, query, args)
+
+    def fetchone(self):
+        with timed('query'):
+            return self.cursor.fetchone()
+
+    def fetchmany(self, *args):
+        with timed('query'):
+            return self.cursor.fetchmany(*args)
+
+    def fetchall(self):
+        with timed('query'):
+            return self.cursor.fetchall()
+
+
+class TimedConnection:
+    def __init__(self, conn, profiler=None):
+        self.conn = conn
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def cursor(self, *args):
+        return TimedCursor(self.conn.cursor(*args), self.profiler)
+
+    def commit(self):
+        with timed('query'):
+            return self.conn.commit()
+
+
+# === READ REPLICAS ===
+# One ConnectionPool per replica, used in turn. The pool's ping on checkout is
+# the health check: a replica that can't connect or answer is skipped for
+# retry_after seconds, and when no replica is usable acquire() returns
+# (None, None) so the caller reads from the primary instead.
+class ReplicaSet:
+    def __init__(self, pools, retry_after=5):
+        self.pools = pools   # [(name, ConnectionPool)]
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.next = 0
+        self.down_until = {}
+        self.failures = {name: 0 for name, _ in pools}
+        self.fallbacks = 0
+
+    def acquire(self):
+        # (pool, connection) from the next healthy replica
+        with self.lock:
+            start = self.next
+            self.next = (self.next + 1) % len(self.pools)
+        for i in range(len(self.pools)):
+            name, pool = self.pools[(start + i) % len(self.pools)]
+            if self.down_until.get(name, 0) > time.monotonic():
+                continue
+            try:
+                return pool, pool.acquire()
+            except PoolTimeout:
+                continue  # busy, not broken
+            except Exception:
+                with self.lock:
+                    self.failures[name] += 1
+                    self.down_until[name] = time.monotonic() + self.retry_after
+        with self.lock:
+            self.fallbacks += 1
+        return None, None
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            replicas = [dict(pool.stats(), name=name, healthy=self.down_until.get(name, 0) <= now,
+                             failures=self.failures[name]) for name, pool in self.pools]
+            return {'replicas': replicas, 'fallbacks_to_primary': self.fallbacks}
+
+
+# === FLASK EXTENSION ===
+# Drop-in replacement for flask_mysqldb.MySQL: `mysql.connection` is a pooled
+# connection checked out on first use in an app context and returned to the
+# pool when the context tears down. With MYSQL_REPLICAS set, requests that call
+# use_replica() get `mysql.read_connection` from a replica; everywhere else
+# read_connection is the primary connection.
+class MySQLPool:
+    def __init__(self, app=None):
+        self.pool = None
+        self.replicas = None
+        self.profiler = None
+        self.warmed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cfg = app.config
+
+        def connector(**endpoint):
+            # endpoint overrides any of the MYSQL_* settings (host, port, user, passwd, db)
+            def connect():
+                settings = dict(
+                    host=cfg.get('MYSQL_HOST', 'localhost'),
+                    user=cfg.get('MYSQL_USER', 'root'),
+                    passwd=cfg.get('MYSQL_PASSWORD', ''),
+                    db=cfg.get('MYSQL_DB'),
+                    port=cfg.get('MYSQL_PORT', 3306),
+                    charset=cfg.get('MYSQL_CHARSET', 'utf8mb4'),
+                    use_unicode=True,
+                    connect_timeout=cfg.get('MYSQL_CONNECT_TIMEOUT', 10),
+                )
+                settings.update(endpoint)
+                return MySQLdb.connect(**settings)
+            return connect
+
+        self.pool = ConnectionPool(
+            connector(),
+            min_size=cfg.get('MYSQL_POOL_MIN_SIZE', 1),
+            max_size=cfg.get('MYSQL_POOL_MAX_SIZE', 10),
+            recycle=cfg.get('MYSQL_POOL_RECYCLE', 3600),
+            timeout=cfg.get('MYSQL_POOL_TIMEOUT', 5),
+            ping=cfg.get('MYSQL_POOL_PING', True),
+        )
+        if cfg.get('MYSQL_REPLICAS'):
+            pools = []
+            for endpoint in cfg['MYSQL_REPLICAS']:
+                host = endpoint.get('host', cfg.get('MYSQL_HOST', 'localhost'))
+                port = endpoint.get('port', cfg.get('MYSQL_PORT', 3306))
+                pools.append((f'{host}:{port}', ConnectionPool(
+                    connector(**endpoint),
+                    max_size=cfg.get('MYSQL_REPLICA_POOL_MAX_SIZE', 10),
+                    recycle=cfg.get('MYSQL_POOL_RECYCLE', 3600),
+                    # A busy replica falls back to the primary rather than queueing
+                    timeout=cfg.get('MYSQL_REPLICA_POOL_TIMEOUT', 0.1),
+                    ping=True,
+                )))
+            self.replicas = ReplicaSet(pools, retry_after=cfg.get('MYSQL_REPLICA_RETRY_AFTER', 5))
+        if cfg.get('SQL_PROFILE_ENABLED', True):
+            self.profiler = SQLProfiler.from_config(cfg, app.logger)
+        app.teardown_appcontext(self.teardown)
+
+    @property
+    def connection(self):
+        conn = g.get('_mysql_pool_conn')
+        if conn is None:
+            with timed('db_acquire'):
+                if not self.warmed:
+                    self.warmed = True
+                    self.pool.warm()
+                conn = TimedConnection(self.pool.acquire(), self.profiler)
+            g._mysql_pool_conn = conn
+        return conn
+
+    def use_replica(self):
+        # Let this request's read_connection come from a replica
+        g._mysql_use_replica = True
+
+    @property
+    def read_connection(self):
+        if self.replicas is None or not g.get('_mysql_use_replica'):
+            return self.connection
+        conn = g.get('_mysql_read_conn')
+        if conn is None:
+            with timed('db_acquire'):
+                pool, raw = self.replicas.acquire()
+            if raw is None:
+                g._mysql_use_replica = False
+                return self.connection
+            conn = g._mysql_read_conn = TimedConnection(raw, self.profiler)
+            g._mysql_read_pool = pool
+        return conn
+
+    @contextmanager
+    def checkout(self):
+        # A short-lived connection of its own, for long-running responses (e.g.
+        # event streams) that must not pin the request's connection
+        conn = self.pool.acquire()
+        try:
+            yield TimedConnection(conn, self.profiler)
+        finally:
+            self.pool.release(conn)
+
+    def teardown(self, exception):
+        if self.profiler is not None:
+            self.profiler.finish_request()
+        conn = g.pop('_mysql_pool_conn', None)
+        if conn is not None:
+            self.pool.release(conn.conn)
+        conn = g.pop('_mysql_read_conn', None)
+        if conn is not None:
+            g.pop('_mysql_read_pool').release(conn.conn)
+
+    def stats(self):
+        stats = self.pool.stats()
+        if self.replicas is not None:
+            stats.update(self.replicas.stats())
+        return stats
@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import deque
+
+
+class WriteQueueFull(Exception):
+    pass
+
+
+class PendingWrite:
+    def __init__(self, row):
+        self.row = row
+        self.queued_at = time.monotonic()
+        self.done = threading.Event()
+        self.id = None
+        self.error = None
+
+
+# === GROUP COMMIT ===
+# Callers hand single rows to submit() and block until their row is written.
+# One background thread collects them and calls write(rows) -> ids with up to
+# max_batch rows, as soon as the batch is full or the oldest row has waited
+# max_delay seconds, so many creates share one INSERT and one commit. When a
+# batch fails with one of row_errors its rows are retried one by one, so only
+# the bad row's caller sees the error; any other error (the database being
+# unreachable) fails the whole batch at once rather than once per row. The
+# queue holds at most max_queue rows; submit() waits up to timeout for room
+# and then raises WriteQueueFull.
+class GroupCommitter:
+    def __init__(self, write, max_batch=100, max_delay=0.005, max_queue=1000, timeout=1.0,
+                 row_errors=(Exception,)):
+        self.write = write
+        self.row_errors = row_errors
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.thread = None
+        self.closed = False
+        self.batches = 0
+        self.rows = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, row):
+        # The id assigned to row; re-raises the error if it couldn't be written
+        pending = PendingWrite(row)
+        deadline = pending.queued_at + self.timeout
+        with self.cond:
+            while len(self.queue) >= self.max_queue and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise WriteQueueFull(f'Write queue full after {self.timeout}s')
+                self.cond.wait(remaining)
+            if self.closed:
+                raise WriteQueueFull('Write queue is shut down')
+            if self.thread is None:
+                # Started on first use so a pre-forking server starts one per worker
+                self.thread = threading.Thread(target=self.run, name='group-commit', daemon=True)
+                self.thread.start()
+            self.queue.append(pending)
+            self.cond.notify_all()
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.id
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+                deadline = self.queue[0].queued_at + self.max_delay
+                while len(self.queue) < self.max_batch and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                batch = [self.queue.popleft() for _ in range(min(len(self.queue), self.max_batch))]
+                self.cond.notify_all()
+            self.flush(batch)
+
+    def flush(self, batch):
+        try:
+            ids = self.write([p.row for p in batch])
+        except Exception as e:
+            if len(batch) > 1 and isinstance(e, self.row_errors):
+                for pending in batch:
+                    self.flush([pending])
+                return
+            with self.cond:
+                self.failed += len(batch)
+            for pending in batch:
+                pending.error = e
+                pending.done.set()
+            return
+        with self.cond:
+            self.batches += 1
+            self.rows += len(batch)
+        for pending, id in zip(batch, ids):
+            pending.id = id
+            pending.done.set()
+
+    def close(self, timeout=30):
+        # Stop taking rows and wait for everything already queued to be written
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'queued': len(self.queue),
+                'max_queue': self.max_queue,
+                'max_batch': self.max_batch,
+                'max_delay_ms': self.max_delay * 1000,
+                'batches': self.batches,
+                'rows': self.rows,
+                'avg_batch': round(self.rows / self.batches, 2) if self.batches else 0.0,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,113 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+PHASES = ('auth', 'db_acquire', 'query', 'serialize', 'render')
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# === PHASE TIMERS ===
+# Each request collects seconds per phase in g._phase_times; code outside a
+# request (startup, scripts) is simply not timed.
+def add_phase_time(name, seconds):
+    times = g.get('_phase_times') if has_app_context() else None
+    if times is not None:
+        times[name] = times.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase_time(name, time.perf_counter() - start)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# === REQUEST METRICS ===
+# Per-route request counts, latency histograms and per-phase histograms, kept
+# in process and rendered in the Prometheus text format. Recording a request
+# is a few dict lookups and bisects under one lock.
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.phases = {}
+
+    def histogram(self, table, key):
+        hist = table.get(key)
+        if hist is None:
+            hist = table[key] = Histogram(self.buckets)
+        return hist
+
+    def observe(self, route, method, status, duration, phase_times):
+        with self.lock:
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.histogram(self.latency, route).observe(duration)
+            for phase, seconds in phase_times.items():
+                self.histogram(self.phases, (route, phase)).observe(seconds)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines += [
+                '# HELP http_requests_total Requests handled, by route, method and status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for (route, method, status), n in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{labels(route=route, method=method, status=status)} {n}')
+            lines += [
+                '# HELP http_request_duration_seconds Time spent in the app per request.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for route, hist in sorted(self.latency.items()):
+                lines += self.histogram_lines('http_request_duration_seconds', hist, route=route)
+            lines += [
+                '# HELP http_request_phase_seconds Time per request spent in each phase '
+                '(' + ', '.join(PHASES) + ').',
+                '# TYPE http_request_phase_seconds histogram',
+            ]
+            for (route, phase), hist in sorted(self.phases.items()):
+                lines += self.histogram_lines('http_request_phase_seconds', hist, route=route, phase=phase)
+        return '\n'.join(lines) + '\n'
+
+    def histogram_lines(self, name, hist, **label_values):
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + ('+Inf',), hist.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{labels(**label_values, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{labels(**label_values)} {hist.sum:.6f}')
+        lines.append(f'{name}_count{labels(**label_values)} {hist.count}')
+        return lines
+
+
+def labels(**values):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(values, escaped)) + '}'
+
+
+def server_timing(phase_times, total):
+    # Server-Timing header value, durations in milliseconds
+    parts = [f'{phase};dur={phase_times[phase] * 1000:.2f}' for phase in PHASES if phase in phase_times]
+    parts.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(parts)
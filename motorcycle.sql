@@ -1,14 +1,78 @@
 CREATE DATABASE motorcycles_db;
 USE motorcycles_db;
 
+CREATE TABLE users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(100) NOT NULL UNIQUE,
+    -- KDF-encoded hash, e.g. pbkdf2_sha256$<iterations>$<salt>$<hash>
+    password VARCHAR(255) NOT NULL
+);
+
 CREATE TABLE motorcycles (
     id INT AUTO_INCREMENT PRIMARY KEY,
     make VARCHAR(100) NOT NULL,
     model VARCHAR(100) NOT NULL,
     year INT NOT NULL,
     engine_cc INT NOT NULL,
-    color VARCHAR(50) NOT NULL
+    color VARCHAR(50) NOT NULL,
+    -- Conditional GET validators (ETag / Last-Modified)
+    version INT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    -- Backs ?search=; the ngram parser lets quoted terms match inside words
+    FULLTEXT INDEX ft_motorcycles_search (make, model, color) WITH PARSER ngram,
+    -- Back the structured filters/sorts on GET /motorcycles. Pages are ordered
+    -- by <sort field>, id, so each index is the equality filter (if any) then
+    -- the sort column; the implicit PK suffix supplies the id tie-breaker and
+    -- rows come out in page order without a filesort.
+    INDEX idx_make (make),
+    INDEX idx_make_year (make, year),
+    INDEX idx_make_cc (make, engine_cc),
+    INDEX idx_year (year),
+    INDEX idx_cc (engine_cc),
+    INDEX idx_color (color)
+);
+
+-- One change counter per table, bumped in the same transaction as every write
+CREATE TABLE table_versions (
+    table_name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+);
+INSERT INTO table_versions (table_name) VALUES ('motorcycles');
+
+-- Append-only change feed for GET /motorcycles/changes. The triggers write it in
+-- the same transaction as every INSERT/UPDATE/DELETE on motorcycles.
+CREATE TABLE motorcycle_changes (
+    seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+    motorcycle_id INT NOT NULL,
+    op VARCHAR(6) NOT NULL,
+    -- Row after the change; NULL for deletes
+    data JSON NULL,
+    changed_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6)
 );
+CREATE TRIGGER motorcycles_log_insert AFTER INSERT ON motorcycles FOR EACH ROW
+    INSERT INTO motorcycle_changes (motorcycle_id, op, data) VALUES (NEW.id, 'insert',
+        JSON_OBJECT('id', NEW.id, 'make', NEW.make, 'model', NEW.model, 'year', NEW.year,
+                    'engine_cc', NEW.engine_cc, 'color', NEW.color));
+CREATE TRIGGER motorcycles_log_update AFTER UPDATE ON motorcycles FOR EACH ROW
+    INSERT INTO motorcycle_changes (motorcycle_id, op, data) VALUES (NEW.id, 'update',
+        JSON_OBJECT('id', NEW.id, 'make', NEW.make, 'model', NEW.model, 'year', NEW.year,
+                    'engine_cc', NEW.engine_cc, 'color', NEW.color));
+CREATE TRIGGER motorcycles_log_delete AFTER DELETE ON motorcycles FOR EACH ROW
+    INSERT INTO motorcycle_changes (motorcycle_id, op) VALUES (OLD.id, 'delete');
+
+-- Existing databases:
+-- ALTER TABLE users MODIFY password VARCHAR(255) NOT NULL;
+-- ALTER TABLE motorcycles ADD COLUMN version INT NOT NULL DEFAULT 1,
+--     ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+-- (then create table_versions as above)
+-- ALTER TABLE motorcycles ADD FULLTEXT INDEX ft_motorcycles_search (make, model, color) WITH PARSER ngram;
+-- ALTER TABLE motorcycles ADD INDEX idx_make (make), ADD INDEX idx_make_year (make, year),
+--     ADD INDEX idx_make_cc (make, engine_cc), ADD INDEX idx_year (year), ADD INDEX idx_cc (engine_cc),
+--     ADD INDEX idx_color (color);
+-- (databases that got the earlier filter indexes:
+--  ALTER TABLE motorcycles DROP INDEX idx_make_year_cc, DROP INDEX idx_year_cc, DROP INDEX idx_cc_year;)
+-- (then create motorcycle_changes and its triggers as above)
 
 -- Insert 21+ realistic motorcycle records
 INSERT INTO motorcycles (make, model, year, engine_cc, color) VALUES
@@ -0,0 +1,127 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def b64(raw):
+    return base64.b64encode(raw).decode().rstrip('=')
+
+
+def unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+# === PASSWORD HASHER ===
+# Hashes are stored with their KDF and cost parameters:
+#   pbkdf2_sha256$<iterations>$<salt>$<hash>
+#   scrypt$<n>$<r>$<p>$<salt>$<hash>
+# Old unsalted sha256 hex digests still verify and are flagged for re-hashing.
+# The KDF work runs on a bounded thread pool (hashlib releases the GIL while
+# hashing); once workers + queue are full, callers get HasherBusy instead of
+# piling up behind the pool.
+class PasswordHasher:
+    def __init__(self, kdf='pbkdf2_sha256', iterations=600000, scrypt_n=2 ** 14, scrypt_r=8,
+                 scrypt_p=1, workers=4, max_pending=32, timeout=10):
+        self.kdf = kdf
+        self.iterations = iterations
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+        self.lock = threading.Lock()
+        # Checked in place of a missing user's hash so unknown usernames cost a
+        # full KDF run too; its digest matches nothing, only the cost matters
+        if kdf == 'scrypt':
+            self.dummy = f'scrypt${scrypt_n}${scrypt_r}${scrypt_p}${b64(bytes(16))}${b64(bytes(64))}'
+        else:
+            self.dummy = f'pbkdf2_sha256${iterations}${b64(bytes(16))}${b64(bytes(32))}'
+        self.hashed = 0
+        self.verified = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            kdf=config['PASSWORD_KDF'],
+            iterations=config['PASSWORD_PBKDF2_ITERATIONS'],
+            scrypt_n=config['PASSWORD_SCRYPT_N'],
+            scrypt_r=config['PASSWORD_SCRYPT_R'],
+            scrypt_p=config['PASSWORD_SCRYPT_P'],
+            workers=config['PASSWORD_HASH_WORKERS'],
+            max_pending=config['PASSWORD_HASH_QUEUE'],
+            timeout=config['PASSWORD_HASH_TIMEOUT'],
+        )
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.rejected += 1
+            raise HasherBusy('Password hashing pool is saturated')
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self.slots.release()
+
+    # --- encoding (runs on the pool) ---
+    def encode(self, password, salt=None):
+        salt = salt or os.urandom(16)
+        if self.kdf == 'scrypt':
+            n, r, p = self.scrypt_n, self.scrypt_r, self.scrypt_p
+            digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                                    maxmem=128 * n * r * p + 1024 * 1024)
+            return f'scrypt${n}${r}${p}${b64(salt)}${b64(digest)}'
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.iterations)
+        return f'pbkdf2_sha256${self.iterations}${b64(salt)}${b64(digest)}'
+
+    def check(self, password, encoded):
+        parts = encoded.split('$')
+        if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode(), unb64(parts[2]), int(parts[1]))
+            return hmac.compare_digest(digest, unb64(parts[3]))
+        if parts[0] == 'scrypt' and len(parts) == 6:
+            n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+            digest = hashlib.scrypt(password.encode(), salt=unb64(parts[4]), n=n, r=r, p=p,
+                                    maxmem=128 * n * r * p + 1024 * 1024)
+            return hmac.compare_digest(digest, unb64(parts[5]))
+        if len(parts) == 1:
+            # Legacy: unsalted sha256 hex digest
+            return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), encoded)
+        return False
+
+    # --- public API ---
+    def hash(self, password):
+        encoded = self.run(self.encode, password)
+        with self.lock:
+            self.hashed += 1
+        return encoded
+
+    def verify(self, password, encoded):
+        # encoded None (no such user) still runs the KDF and returns False
+        ok = self.run(self.check, password, encoded or self.dummy) and encoded is not None
+        with self.lock:
+            self.verified += 1
+        return ok
+
+    def needs_rehash(self, encoded):
+        parts = encoded.split('$')
+        if self.kdf == 'scrypt':
+            return parts[0] != 'scrypt' or parts[1:4] != [str(self.scrypt_n), str(self.scrypt_r), str(self.scrypt_p)]
+        return parts[0] != 'pbkdf2_sha256' or parts[1] != str(self.iterations)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'kdf': self.kdf,
+                'hashed': self.hashed,
+                'verified': self.verified,
+                'rejected': self.rejected,
+            }
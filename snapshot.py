@@ -0,0 +1,251 @@
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from itertools import compress
+
+try:
+    import numpy
+except ImportError:  # numpy is optional; without it scans run as list comprehensions
+    numpy = None
+
+ENCODED_COLUMNS = ('make', 'model', 'color')
+NUMERIC_COLUMNS = ('year', 'engine_cc')
+# Attributes holding the columns, swapped in one go when a load finishes
+STORAGE = ('ids', 'years', 'ccs', 'alive', 'codes', 'values', 'lookup', 'positions', 'dead')
+
+
+# === COLUMNAR INVENTORY SNAPSHOT ===
+# An in-process copy of the motorcycles table laid out column by column:
+# id/year/engine_cc live in typed arrays, make/model/color are dictionary-encoded
+# (one int code per row plus a shared list of distinct strings). A query holds
+# the lock only to copy the columns it needs; filters then run outside it, a
+# column at a time on int codes instead of strings, as numpy masks when numpy is
+# installed and as list comprehensions otherwise.
+# Deleted rows are tombstoned and squeezed out once they pass a quarter of the
+# rows. The snapshot is reloaded whenever it is older than max_age (0 = never);
+# writers are not blocked while the new copy streams in.
+class InventorySnapshot:
+    def __init__(self, max_age=0):
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.loaded_at = None
+        # Writes logged while a load is running, replayed onto the new columns
+        self.pending = None
+        self.reset()
+
+    def reset(self):
+        self.ids = array('q')
+        self.years = array('i')
+        self.ccs = array('i')
+        self.alive = bytearray()
+        self.codes = {c: array('i') for c in ENCODED_COLUMNS}
+        self.values = {c: [] for c in ENCODED_COLUMNS}
+        self.lookup = {c: {} for c in ENCODED_COLUMNS}
+        self.positions = {}
+        self.dead = 0
+
+    # --- loading & consistency ---
+    def load(self, rows):
+        # The new columns are built without the lock while the old ones keep
+        # serving; writes that land meanwhile are logged and replayed onto the
+        # new columns as they are swapped in
+        with self.lock:
+            self.pending = []
+        try:
+            fresh = InventorySnapshot()
+            for row in rows:
+                fresh.append(dict(zip(('id', 'make', 'model', 'year', 'engine_cc', 'color'), row)))
+            with self.lock:
+                for name in STORAGE:
+                    setattr(self, name, getattr(fresh, name))
+                loaded_at = time.monotonic()
+                for op, arg in self.pending:
+                    if op == 'upsert':
+                        self.put(arg)
+                    elif op == 'delete':
+                        self.remove(arg)
+                    else:
+                        loaded_at = None
+                self.loaded_at = loaded_at
+        finally:
+            with self.lock:
+                self.pending = None
+
+    def log(self, op, arg=None):
+        if self.pending is not None:
+            self.pending.append((op, arg))
+
+    def stale(self):
+        if self.loaded_at is None:
+            return True
+        return bool(self.max_age) and time.monotonic() - self.loaded_at > self.max_age
+
+    def invalidate(self):
+        # Changes we can't apply row by row (e.g. bulk imports) force a reload
+        with self.lock:
+            self.log('invalidate')
+            self.loaded_at = None
+
+    # --- incremental updates from the write paths ---
+    def encode(self, column, value):
+        code = self.lookup[column].get(value)
+        if code is None:
+            code = len(self.values[column])
+            self.values[column].append(value)
+            self.lookup[column][value] = code
+        return code
+
+    def append(self, mc):
+        self.positions[mc['id']] = len(self.ids)
+        self.ids.append(mc['id'])
+        self.years.append(mc['year'])
+        self.ccs.append(mc['engine_cc'])
+        for c in ENCODED_COLUMNS:
+            self.codes[c].append(self.encode(c, mc[c]))
+        self.alive.append(1)
+
+    def upsert(self, mc):
+        with self.lock:
+            self.log('upsert', mc)
+            self.put(mc)
+
+    def delete(self, id):
+        with self.lock:
+            self.log('delete', id)
+            self.remove(id)
+
+    def put(self, mc):
+        pos = self.positions.get(mc['id'])
+        if pos is None:
+            self.append(mc)
+            return
+        self.years[pos] = mc['year']
+        self.ccs[pos] = mc['engine_cc']
+        for c in ENCODED_COLUMNS:
+            self.codes[c][pos] = self.encode(c, mc[c])
+
+    def remove(self, id):
+        pos = self.positions.pop(id, None)
+        if pos is None:
+            return
+        self.alive[pos] = 0
+        self.dead += 1
+        if self.dead * 4 > len(self.ids):
+            self.compact()
+
+    def compact(self):
+        live = [self.row(pos) for pos in range(len(self.ids)) if self.alive[pos]]
+        self.reset()
+        for mc in live:
+            self.append(mc)
+
+    def row(self, pos):
+        mc = {'id': self.ids[pos], 'year': self.years[pos], 'engine_cc': self.ccs[pos]}
+        for c in ENCODED_COLUMNS:
+            mc[c] = self.values[c][self.codes[c][pos]]
+        return mc
+
+    # --- scans ---
+    def column(self, name):
+        return self.codes[name] if name in ENCODED_COLUMNS else self.years if name == 'year' else self.ccs
+
+    def select(self, group=None, make=None, color=None, year_min=None, year_max=None, cc_min=None, cc_max=None):
+        # Under the lock: resolve filters to (column, lo, hi) conditions on codes
+        # and values, and copy the live flags and the columns the query touches
+        # (one memcpy each). None when an equality filter matches no row.
+        with self.lock:
+            conditions = []
+            for name, value in (('make', make), ('color', color)):
+                if value is not None:
+                    code = self.lookup[name].get(value)
+                    if code is None:
+                        return None
+                    conditions.append((name, code, code))
+            for name, lo, hi in (('year', year_min, year_max), ('engine_cc', cc_min, cc_max)):
+                if lo is not None or hi is not None:
+                    conditions.append((name, lo, hi))
+            names = {name for name, _, _ in conditions}
+            if group:
+                names.add(group)
+            cols = {name: self.column(name)[:] for name in names}
+            cols['alive'] = bytes(self.alive)
+            # values lists are append-only, so every code in the copies stays valid
+            cols['values'] = self.values.get(group)
+        return cols, conditions
+
+    def scan(self, **filters):
+        # Positions of the live rows matching filters
+        return list(self.matching(self.select(**filters)))
+
+    def count(self, **filters):
+        return len(self.matching(self.select(**filters)))
+
+    def group_by(self, column, **filters):
+        selected = self.select(group=column, **filters)
+        sel = self.matching(selected)
+        if not len(sel):
+            return []
+        col, names = selected[0][column], selected[0]['values']
+        if numpy is not None:
+            keys, counts = numpy.unique(numpy.frombuffer(col, dtype=col.typecode)[sel], return_counts=True)
+            groups = zip(keys.tolist(), counts.tolist())
+        else:
+            groups = Counter(map(col.__getitem__, sel)).items()
+        if names is not None:
+            groups = [(names[code], n) for code, n in groups]
+        return [{'value': value, 'count': n} for value, n in sorted(groups, key=lambda g: (-g[1], str(g[0])))]
+
+    @staticmethod
+    def matching(selected):
+        # Runs outside the lock, on the copies taken by select()
+        if selected is None:
+            return []
+        cols, conditions = selected
+        alive = cols['alive']
+        if numpy is not None and alive:
+            mask = numpy.frombuffer(alive, dtype=numpy.bool_).copy()
+            for name, lo, hi in conditions:
+                values = numpy.frombuffer(cols[name], dtype=cols[name].typecode)
+                if lo == hi:
+                    mask &= values == lo
+                    continue
+                if lo is not None:
+                    mask &= values >= lo
+                if hi is not None:
+                    mask &= values <= hi
+            return numpy.flatnonzero(mask)
+        sel = list(compress(range(len(alive)), alive))
+        for name, lo, hi in conditions:
+            col = cols[name]
+            if lo == hi:
+                sel = [i for i in sel if col[i] == lo]
+                continue
+            if lo is not None:
+                sel = [i for i in sel if col[i] >= lo]
+            if hi is not None:
+                sel = [i for i in sel if col[i] <= hi]
+        return sel
+
+    # --- reporting ---
+    def memory(self):
+        with self.lock:
+            columns = {
+                'id': self.ids.itemsize * len(self.ids),
+                'year': self.years.itemsize * len(self.years),
+                'engine_cc': self.ccs.itemsize * len(self.ccs),
+                'alive': len(self.alive),
+            }
+            for c in ENCODED_COLUMNS:
+                columns[c] = (self.codes[c].itemsize * len(self.codes[c]) +
+                              sum(sys.getsizeof(v) for v in self.values[c]))
+            return {
+                'rows': len(self.positions),
+                'tombstones': self.dead,
+                'distinct': {c: len(self.values[c]) for c in ENCODED_COLUMNS},
+                'column_bytes': columns,
+                'index_bytes': sys.getsizeof(self.positions),
+                'total_bytes': sum(columns.values()) + sys.getsizeof(self.positions),
+                'age_seconds': round(time.monotonic() - self.loaded_at, 3) if self.loaded_at else None,
+            }
@@ -0,0 +1,139 @@
+import logging
+import re
+import threading
+from functools import lru_cache
+
+from flask import g, has_app_context, has_request_context, request
+
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    # Literals and placeholders become ?, lists of them (IN, VALUES) collapse to
+    # (?+) so "WHERE id IN (1, 2)" and "... IN (3, 4, 5)" share a fingerprint.
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = VALUE_LIST.sub('(?+)', sql)
+    return ' '.join(sql.split())
+
+
+def redact_value(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (str, bytes)):
+        return f'<{type(value).__name__} len={len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def redact(params):
+    # Parameter values never reach the logs, only their types (and lengths)
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        return {k: redact_value(v) for k, v in params.items()}
+    params = list(params)
+    if params and isinstance(params[0], (list, tuple, dict)):
+        return f'<{len(params)} rows>'  # executemany
+    return [redact_value(v) for v in params]
+
+
+def current_route():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return '-'
+
+
+# === SQL PROFILER ===
+# Fed by db_pool.TimedCursor with every statement the app runs. Keeps running
+# totals per statement fingerprint (bounded; overflow goes to '<other>'),
+# logs statements slower than slow_ms, and at the end of each request flags
+# fingerprints executed n_plus_one times or more as a likely N+1 pattern.
+class SQLProfiler:
+    def __init__(self, slow_ms=200, max_fingerprints=1000, n_plus_one=10, logger=None):
+        self.slow_ms = slow_ms
+        self.max_fingerprints = max_fingerprints
+        self.n_plus_one = n_plus_one
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.n_plus_one_seen = {}
+        self.executed = 0
+        self.slow = 0
+
+    @classmethod
+    def from_config(cls, config, logger=None):
+        path = config.get('SQL_SLOW_QUERY_LOG')
+        if path:
+            logger = logging.getLogger('motorcycles.slow_queries')
+            if not logger.handlers:
+                handler = logging.FileHandler(path)
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                logger.addHandler(handler)
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+        return cls(
+            slow_ms=config.get('SQL_SLOW_QUERY_MS', 200),
+            max_fingerprints=config.get('SQL_PROFILE_MAX_FINGERPRINTS', 1000),
+            n_plus_one=config.get('SQL_N_PLUS_ONE_THRESHOLD', 10),
+            logger=logger,
+        )
+
+    def record(self, sql, params, seconds, rows):
+        fp = fingerprint(sql)
+        ms = seconds * 1000
+        route = current_route()
+        with self.lock:
+            self.executed += 1
+            stats = self.statements.get(fp)
+            if stats is None:
+                key = fp if len(self.statements) < self.max_fingerprints else '<other>'
+                stats = self.statements.setdefault(key, {
+                    'fingerprint': key, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0, 'routes': {},
+                })
+            stats['count'] += 1
+            stats['total_ms'] += ms
+            stats['max_ms'] = max(stats['max_ms'], ms)
+            if rows is not None:
+                stats['rows'] += rows
+            stats['routes'][route] = stats['routes'].get(route, 0) + 1
+            if ms >= self.slow_ms:
+                self.slow += 1
+        if ms >= self.slow_ms:
+            self.logger.warning('slow query %.1fms rows=%s route=%s sql=%s params=%s',
+                                ms, rows, route, fp, redact(params))
+        if has_app_context():
+            counts = g.setdefault('_sql_counts', {})
+            counts[fp] = counts.get(fp, 0) + 1
+            g.setdefault('_sql_route', route)
+
+    def finish_request(self):
+        counts = g.pop('_sql_counts', None)
+        route = g.pop('_sql_route', '-')
+        if not counts:
+            return
+        for fp, n in counts.items():
+            if n >= self.n_plus_one:
+                with self.lock:
+                    key = (route, fp)
+                    self.n_plus_one_seen[key] = self.n_plus_one_seen.get(key, 0) + 1
+                self.logger.warning('possible N+1: %d executions of %s in one request to %s', n, fp, route)
+
+    def top(self, n=20, key='total_ms'):
+        with self.lock:
+            rows = [dict(s, routes=[{'route': r, 'count': c} for r, c in s['routes'].items()])
+                    for s in self.statements.values()]
+            n_plus_one = [{'route': route, 'fingerprint': fp, 'requests': count}
+                          for (route, fp), count in self.n_plus_one_seen.items()]
+            totals = {'executed': self.executed, 'slow': self.slow, 'fingerprints': len(self.statements)}
+        rows.sort(key=lambda s: s[key], reverse=True)
+        for s in rows:
+            s['routes'].sort(key=lambda r: r['count'], reverse=True)
+            s['avg_ms'] = round(s['total_ms'] / s['count'], 3)
+            s['total_ms'] = round(s['total_ms'], 3)
+            s['max_ms'] = round(s['max_ms'], 3)
+        n_plus_one.sort(key=lambda s: s['requests'], reverse=True)
+        return dict(totals, slow_ms=self.slow_ms, statements=rows[:n], n_plus_one=n_plus_one)
@@ -1,66 +1,800 @@
 import unittest
+import asyncio
+import datetime
+import gzip
+import hashlib
+import io
 import json
-from app import app
+import re
+import threading
+import time
+import xml.dom.minidom
+from unittest import mock
+from xml.etree.ElementTree import Element, SubElement, tostring
+from flask import Response, request as flask_request
+from admission import AdmissionController, MemoryBuckets, Rejected
+from app import (app, build_filters, get_page_args, insert_bulk_rows, invalidate_motorcycle, is_not_modified,
+                 iter_json_array, iter_xml, keyset_condition, motorcycle_row, motorcycles_table_version, page_cursor,
+                 parse_ids, parse_sort, revoke_token, validate_motorcycle, verify_token)
+from bench import (SCHEMA_FILE, InProcessDriver, percentile, run_scenario, sample_rows, schema_statements, seed,
+                   synthetic_rows)
+from cache import ExpiringSet, LRUCache, RedisCache, make_expiring_set
+from changefeed import ChangeFeed
+from compression import StaticPage, compress_response, iter_compress
+from db_pool import ConnectionPool, PoolTimeout, ReplicaSet
+from group_commit import GroupCommitter, WriteQueueFull
+from metrics import Metrics, server_timing
+from sql_profile import SQLProfiler, fingerprint, redact
+from passwords import PasswordHasher
+import snapshot
+from snapshot import InventorySnapshot
+import jwt
+import MySQLdb
+
+try:
+    import asgi
+except ImportError:  # quart/aiomysql are only needed for the async serving mode
+    asgi = None
 
 class MotorcycleAPITestCase(unittest.TestCase):
+    # Needs the MySQL database from motorcycle.sql
     def setUp(self):
         self.app = app.test_client()
         self.app.testing = True
-        # Get token
-        resp = self.app.post('/login')
-        self.token = json.loads(resp.data)['token']
+        # /login is a form post; the JWT ends up in the session cookie
+        self.app.post('/register', data={'username': 'api-test', 'password': 'api-test-pw'})
+        resp = self.app.post('/login', data={'username': 'api-test', 'password': 'api-test-pw'})
+        self.assertEqual(resp.status_code, 302)
 
-    def test_create(self):
-        resp = self.app.post('/motorcycles', json={
-            'make': 'TestBrand',
+    def create(self, make):
+        return self.app.post('/motorcycles/new', data={
+            'make': make,
             'model': 'TestModel',
             'year': 2025,
             'engine_cc': 500,
             'color': 'Test Red'
-        }, headers={'x-access-token': self.token})
-        self.assertEqual(resp.status_code, 201)
+        })
+
+    def test_create(self):
+        resp = self.create('TestBrand')
+        self.assertEqual(resp.status_code, 302)
 
     def test_get_all_json(self):
-        resp = self.app.get('/motorcycles', headers={'x-access-token': self.token})
+        resp = self.app.get('/motorcycles?format=json')
         self.assertEqual(resp.status_code, 200)
         self.assertIn('application/json', resp.content_type)
 
     def test_get_all_xml(self):
-        resp = self.app.get('/motorcycles?format=xml', headers={'x-access-token': self.token})
+        resp = self.app.get('/motorcycles?format=xml')
         self.assertEqual(resp.status_code, 200)
         self.assertIn('application/xml', resp.content_type)
 
     def test_search(self):
-        resp = self.app.get('/motorcycles?search=Yamaha', headers={'x-access-token': self.token})
+        resp = self.app.get('/motorcycles?format=json&search=Yamaha')
         data = json.loads(resp.data)
         self.assertGreater(len(data), 0)
 
     def test_get_one(self):
-        resp = self.app.get('/motorcycles/1', headers={'x-access-token': self.token})
+        resp = self.app.get('/motorcycles/1?format=json')
         self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.data)['id'], 1)
 
     def test_update(self):
-        resp = self.app.put('/motorcycles/1', json={
+        resp = self.app.post('/motorcycles/1', data={
             'make': 'UpdatedMake',
             'model': 'UpdatedModel',
             'year': 2026,
             'engine_cc': 700,
             'color': 'Updated Blue'
-        }, headers={'x-access-token': self.token})
-        self.assertEqual(resp.status_code, 200)
+        })
+        self.assertEqual(resp.status_code, 302)
 
     def test_delete(self):
-        # Create then delete (assume new ID is 23)
-        self.app.post('/motorcycles', json={
-            'make': 'ToDelete',
-            'model': 'X1',
-            'year': 2025,
-            'engine_cc': 300,
-            'color': 'Black'
-        }, headers={'x-access-token': self.token})
-        resp = self.app.delete('/motorcycles/23', headers={'x-access-token': self.token})
-        # Accept 200 or 404 (if ID not 23)
-        self.assertIn(resp.status_code, [200, 404])
+        self.create('ToDelete')
+        resp = self.app.get('/motorcycles?format=json&make=ToDelete&sort=-id&limit=1')
+        new_id = json.loads(resp.data)[0]['id']
+        resp = self.app.delete(f'/motorcycles/{new_id}?format=json')
+        self.assertEqual(resp.status_code, 200)
+        resp = self.app.get(f'/motorcycles/{new_id}?format=json')
+        self.assertEqual(resp.status_code, 404)
+
+    def test_bulk_update_and_delete(self):
+        self.create('BulkBrand')
+        self.create('BulkBrand')
+        target = {'filter': {'make': 'BulkBrand'}}
+        resp = self.app.patch('/motorcycles/bulk?dry_run=1', json=dict(target, set={'color': 'Bulk Black'}))
+        self.assertGreaterEqual(json.loads(resp.data)['matched'], 2)
+        resp = self.app.patch('/motorcycles/bulk', json=dict(target, set={'color': 'Bulk Black'}))
+        self.assertGreaterEqual(json.loads(resp.data)['affected'], 2)
+        resp = self.app.get('/motorcycles?format=json&make=BulkBrand')
+        self.assertEqual({mc['color'] for mc in json.loads(resp.data)}, {'Bulk Black'})
+        resp = self.app.delete('/motorcycles/bulk', json=target)
+        self.assertGreaterEqual(json.loads(resp.data)['affected'], 2)
+        resp = self.app.get('/motorcycles?format=json&make=BulkBrand')
+        self.assertEqual(json.loads(resp.data), [])
+
+    def test_bulk_rejects_empty_filter(self):
+        resp = self.app.delete('/motorcycles/bulk', json={'filter': {}})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.app.patch('/motorcycles/bulk', json={'ids': [1], 'set': {'price': 1}})
+        self.assertEqual(resp.status_code, 400)
+
+@unittest.skipIf(asgi is None, 'quart and aiomysql are not installed')
+class AsyncAPITestCase(unittest.TestCase):
+    # Needs the MySQL database from motorcycle.sql
+    def test_streamed_export(self):
+        token = jwt.encode({'user': 'api-test', 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+                           app.config['SECRET_KEY'], algorithm='HS256')
+        batch_size = asgi.app.config['STREAM_BATCH_SIZE']
+        asgi.app.config['STREAM_BATCH_SIZE'] = 2  # several fetchmany round trips
+
+        async def export():
+            async with asgi.app.test_app() as test_app:
+                client = test_app.test_client()
+                resp = await client.get('/motorcycles?format=ndjson', headers={'x-access-token': token})
+                body = await resp.get_data(as_text=True)
+                # Every connection, including the one the body streamed from, is back
+                self.assertEqual(asgi.mysql.pool.freesize, asgi.mysql.pool.size)
+                return resp.status_code, body
+
+        try:
+            status, body = asyncio.run(export())
+        finally:
+            asgi.app.config['STREAM_BATCH_SIZE'] = batch_size
+        self.assertEqual(status, 200)
+        ids = [json.loads(line)['id'] for line in body.splitlines()]
+        self.assertGreater(len(ids), 2)
+        self.assertEqual(ids, sorted(ids))
+
+class XMLWriterTestCase(unittest.TestCase):
+    def minidom_xml(self, data):
+        # The ElementTree -> minidom round trip format_response used to do
+        root = Element('response')
+        if isinstance(data, list):
+            for item in data:
+                mc_elem = SubElement(root, 'motorcycle')
+                for key, val in item.items():
+                    SubElement(mc_elem, key).text = str(val)
+        else:
+            for key, val in data.items():
+                SubElement(root, key).text = str(val)
+        return xml.dom.minidom.parseString(tostring(root, 'utf-8')).toprettyxml(indent="  ")
+
+    def test_matches_minidom_output(self):
+        samples = [
+            [{'id': 1, 'make': 'Ducati', 'model': 'Panigale "V4" <R> & co', 'year': 2023, 'engine_cc': 1103, 'color': ''}],
+            [],
+            {'message': 'Deleted'},
+            {'error': 'Not found'},
+        ]
+        for data in samples:
+            self.assertEqual(''.join(iter_xml(data)), self.minidom_xml(data))
+
+    def test_compact(self):
+        self.assertEqual(''.join(iter_xml([{'id': 1}], pretty=False)),
+                         '<?xml version="1.0" ?><response><motorcycle><id>1</id></motorcycle></response>')
+
+class IterJsonArrayTestCase(unittest.TestCase):
+    def parse(self, body, chunk_size=3):
+        return list(iter_json_array(io.StringIO(body), chunk_size))
+
+    def test_valid_arrays(self):
+        body = ' [ {"make": "Yamaha", "note": "a, b ] c"} ,\n 12345 , "x y" ,true,null, 1.5e-3, -20.25 ] '
+        expected = [{'make': 'Yamaha', 'note': 'a, b ] c'}, 12345, 'x y', True, None, 1.5e-3, -20.25]
+        for chunk_size in (1, 2, 3, 7, 65536):
+            self.assertEqual(self.parse(body, chunk_size), expected)
+
+    def test_empty_arrays(self):
+        self.assertEqual(self.parse('[]'), [])
+        self.assertEqual(self.parse(' [ \n ] ', 1), [])
+
+    def test_malformed_arrays(self):
+        for body in ('[1,,2]', '[1 2]', '[,1]', '[1,]', '[,]', '{"a": 1}', '[1, 2', '[1, tru]', ''):
+            with self.subTest(body=body), self.assertRaises(ValueError):
+                self.parse(body)
+
+    def test_bad_element_fails_before_reading_the_rest(self):
+        body = io.StringIO('[{"a": 1}, {bad}, ' + '{"a": 2}, ' * 30000 + '{"a": 2}]')
+        reads = []
+        read = body.read
+        body.read = lambda n: reads.append(n) or read(n)
+        with self.assertRaises(ValueError):
+            list(iter_json_array(body, 1024))
+        self.assertEqual(len(reads), 1)
+
+class BulkImportTestCase(unittest.TestCase):
+    ROW = {'make': 'Yamaha', 'model': 'R1', 'year': 2022, 'engine_cc': '998', 'color': 'Blue'}
+
+    def test_validate_uses_form_integer_rules(self):
+        self.assertEqual(validate_motorcycle(self.ROW), ('Yamaha', 'R1', 2022, 998, 'Blue'))
+        for field, value in (('year', 2020.7), ('year', True), ('engine_cc', '998.5'), ('engine_cc', [998])):
+            with self.subTest(field=field, value=value), self.assertRaises(ValueError):
+                validate_motorcycle(dict(self.ROW, **{field: value}))
+        with self.assertRaisesRegex(ValueError, 'color'):
+            validate_motorcycle(dict(self.ROW, color='x' * 51))
+
+    def test_failed_batch_is_retried_row_by_row(self):
+        def executemany(sql, rows):
+            if any(row[4] == 'bad' for row in rows):
+                raise MySQLdb.DataError(1406, "Data too long for column 'color'")
+        conn, cur = mock.Mock(), mock.Mock()
+        cur.executemany.side_effect = executemany
+        errors = []
+        rows = [('Yamaha', 'R1', 2022, 998, color) for color in ('Blue', 'bad', 'Red')]
+        inserted = insert_bulk_rows(conn, cur, rows, [1, 2, 3], lambda n, e: errors.append(n))
+        self.assertEqual((inserted, errors), (2, [2]))
+
+    def test_connection_errors_fail_the_batch(self):
+        conn, cur = mock.Mock(), mock.Mock()
+        cur.executemany.side_effect = MySQLdb.OperationalError(2006, 'MySQL server has gone away')
+        errors = []
+        self.assertEqual(insert_bulk_rows(conn, cur, [()] * 3, [1, 2, 3], lambda n, e: errors.append(n)), 0)
+        self.assertEqual((errors, cur.executemany.call_count), ([1, 2, 3], 1))
+
+class ListQueryTestCase(unittest.TestCase):
+    def test_get_page_args_clamps_limit(self):
+        with mock.patch.dict(app.config, MOTORCYCLES_PAGE_SIZE=20, MOTORCYCLES_MAX_PAGE_SIZE=100):
+            self.assertEqual(get_page_args({}), (20, ''))
+            self.assertEqual(get_page_args({'limit': '50', 'after': '7'}), (50, '7'))
+            self.assertEqual(get_page_args({'limit': '5000'}), (100, ''))
+            self.assertEqual(get_page_args({'limit': '0'}), (1, ''))
+            self.assertEqual(get_page_args({'limit': '-3'}), (1, ''))
+            self.assertEqual(get_page_args({'limit': 'all'}), (20, ''))
+
+    def test_build_filters(self):
+        where, params = build_filters({'make': 'Honda', 'color': '', 'year_min': '2020', 'cc_max': '0'})
+        self.assertEqual(where, ['make = %s', 'year >= %s', 'engine_cc <= %s'])
+        self.assertEqual(params, ['Honda', 2020, 0])
+        with self.assertRaisesRegex(ValueError, 'year_max'):
+            build_filters({'year_max': 'soon'})
+
+    def test_parse_sort(self):
+        self.assertEqual(parse_sort({}), ('id', False))
+        self.assertEqual(parse_sort({'sort': '-year'}), ('year', True))
+        self.assertEqual(parse_sort({'sort': 'engine_cc:DESC'}), ('engine_cc', True))
+        self.assertEqual(parse_sort({'sort': 'make:asc'}), ('make', False))
+        for sort in ('year:sideways', 'price', '-color'):
+            with self.subTest(sort=sort), self.assertRaises(ValueError):
+                parse_sort({'sort': sort})
+
+    def test_keyset_condition(self):
+        self.assertEqual(keyset_condition('id', True, '42'), ('id < %s', [42]))
+        self.assertEqual(keyset_condition('year', False, '2020,42'),
+                         ('(year > %s OR (year = %s AND id > %s))', [2020, 2020, 42]))
+        self.assertEqual(keyset_condition('year', True, '2020,42')[0], '(year < %s OR (year = %s AND id < %s))')
+        # Only the last comma separates the id, so makes may contain commas
+        self.assertEqual(keyset_condition('make', False, 'Harley, Davidson,42')[1],
+                         ['Harley, Davidson', 'Harley, Davidson', 42])
+        for field, after in (('id', 'x'), ('year', '42'), ('make', '42'), ('year', 'new,42'), ('make', 'Honda,')):
+            with self.subTest(field=field, after=after), self.assertRaises(ValueError):
+                keyset_condition(field, False, after)
+
+    def test_page_cursor_round_trip(self):
+        mc = {'id': 7, 'make': 'Moto, Guzzi', 'year': 2019, 'engine_cc': 850}
+        self.assertEqual(page_cursor('id', mc), '7')
+        for field in ('make', 'year', 'engine_cc'):
+            self.assertEqual(keyset_condition(field, True, page_cursor(field, mc))[1], [mc[field], mc[field], 7])
+
+class ParseIdsTestCase(unittest.TestCase):
+    def test_parse_ids(self):
+        self.assertEqual(parse_ids([3, '1', ' 2 ']), [3, 1, 2])
+        self.assertEqual(parse_ids([]), [])
+        with self.assertRaisesRegex(ValueError, 'list'):
+            parse_ids('1,2')
+        with self.assertRaisesRegex(ValueError, 'At most 2'):
+            parse_ids([1, 2, 3], max_ids=2)
+        with mock.patch.dict(app.config, MULTIGET_MAX_IDS=3):
+            self.assertEqual(len(parse_ids([1, 2, 3])), 3)
+            self.assertRaises(ValueError, parse_ids, [1, 2, 3, 4])
+        for bad in (None, 'x', '1.5', 1.5, True, {'id': 1}):
+            with self.subTest(bad=bad), self.assertRaisesRegex(ValueError, 'integers'):
+                parse_ids([1, bad])
+
+class ConditionalGetTestCase(unittest.TestCase):
+    def not_modified(self, headers, etag='list-7-abc', last_modified=1700000000.5):
+        with app.test_request_context(headers=headers):
+            return is_not_modified(etag, last_modified)
+
+    def test_is_not_modified(self):
+        self.assertFalse(self.not_modified({}))
+        # Weak comparison: the compression layer may have re-encoded the body
+        self.assertTrue(self.not_modified({'If-None-Match': 'W/"list-7-abc"'}))
+        self.assertTrue(self.not_modified({'If-None-Match': '"other", "list-7-abc"'}))
+        self.assertFalse(self.not_modified({'If-None-Match': 'W/"list-6-abc"'}))
+        # If-Modified-Since has one-second resolution and is ignored when an ETag was sent
+        self.assertTrue(self.not_modified({'If-Modified-Since': 'Tue, 14 Nov 2023 22:13:20 GMT'}))
+        self.assertFalse(self.not_modified({'If-Modified-Since': 'Tue, 14 Nov 2023 22:13:19 GMT'}))
+        self.assertFalse(self.not_modified({'If-Modified-Since': 'Tue, 14 Nov 2023 22:13:20 GMT',
+                                            'If-None-Match': 'W/"list-6-abc"'}))
+        self.assertFalse(self.not_modified({'If-Modified-Since': 'Tue, 14 Nov 2023 22:13:20 GMT'}, last_modified=None))
+
+    def test_table_version_cached_until_a_write(self):
+        mysql = mock.Mock()
+        mysql.read_connection.cursor.return_value.fetchone.return_value = (7, 1700000000)
+        with mock.patch('app.mysql', mysql):
+            invalidate_motorcycle()
+            self.assertEqual(motorcycles_table_version(), (7, 1700000000.0))
+            self.assertEqual(motorcycles_table_version(), (7, 1700000000.0))
+            self.assertEqual(mysql.read_connection.cursor.call_count, 1)
+            invalidate_motorcycle()
+            motorcycles_table_version()
+            self.assertEqual(mysql.read_connection.cursor.call_count, 2)
+
+class CompressionTestCase(unittest.TestCase):
+    CONFIG = {'COMPRESS_MIMETYPES': ['application/json'], 'COMPRESS_LEVEL': 6, 'COMPRESS_MIN_SIZE': 100}
+
+    def test_iter_compress_round_trip(self):
+        chunks = iter(['{"a": ', b'1}', '\n' * 500])
+        body = b''.join(iter_compress(chunks, 'gzip'))
+        self.assertEqual(gzip.decompress(body), b'{"a": 1}' + b'\n' * 500)
+
+    def test_static_page_304_on_matching_etag(self):
+        page = StaticPage('<h1>Login</h1>')
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            resp = page.response(flask_request)
+        self.assertEqual(gzip.decompress(resp.get_data()), b'<h1>Login</h1>')
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip', 'If-None-Match': resp.headers['ETag']}):
+            self.assertEqual(page.response(flask_request).status_code, 304)
+        # The ETag is per encoding, so an identity client must not match it
+        with app.test_request_context(headers={'If-None-Match': resp.headers['ETag']}):
+            self.assertEqual(page.response(flask_request).status_code, 200)
+
+    def compress(self, body, mimetype='application/json', **kwargs):
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            return compress_response(Response(body, mimetype=mimetype, **kwargs), flask_request, self.CONFIG)
+
+    def test_min_size_and_passthrough_rules(self):
+        big = '[' + '1, ' * 100 + '1]'
+        resp = self.compress(big)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(resp.get_data()).decode(), big)
+        self.assertNotIn('Content-Encoding', self.compress('[1]').headers)
+        self.assertNotIn('Content-Encoding', self.compress(big, mimetype='image/png').headers)
+        self.assertNotIn('Content-Encoding', self.compress('', status=304).headers)
+        self.assertEqual(self.compress(big, headers={'Content-Encoding': 'br'}).get_data().decode(), big)
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def test_rows_never_share_a_cache_key(self):
+        row = {'id': 1, 'year': 2022, 'engine_cc': 998, 'color': 'Blue'}
+        with app.test_request_context():
+            first = motorcycle_row(dict(row, make='A|B', model='C'))
+            second = motorcycle_row(dict(row, make='A', model='B|C'))
+        self.assertIn('A|B', first)
+        self.assertIn('B|C', second)
+        self.assertNotEqual(first, second)
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        c = LRUCache(max_entries=2, ttl=60)
+        c.set('a', 1); c.set('b', 2)
+        c.get('a')
+        c.set('c', 3)
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(c.get('a'), 1)
+        self.assertEqual(c.stats()['evictions'], 1)
+
+    def test_ttl_expiry(self):
+        c = LRUCache(ttl=60)
+        c.set('a', 1, ttl=-1)
+        self.assertIsNone(c.get('a'))
+        self.assertEqual(c.stats()['misses'], 1)
+
+class ExpiringSetTestCase(unittest.TestCase):
+    def test_keeps_keys_until_expiry(self):
+        s = ExpiringSet()
+        s.add('old', time.time() - 1)
+        s.add('new', time.time() + 60)
+        self.assertNotIn('old', s)
+        self.assertIn('new', s)
+        s.add('other', time.time() + 60)
+        self.assertEqual(s.stats()['entries'], 2)
+
+    def test_shared_through_redis(self):
+        store = {}
+        client = mock.Mock(set=lambda key, value, ex: store.__setitem__(key, ex),
+                           exists=lambda key: int(key in store))
+        for worker in (make_expiring_set(RedisCache(client), 'revoked'),
+                       make_expiring_set(RedisCache(client), 'revoked')):
+            worker.add('gone', time.time() - 1)
+            worker.add('token', time.time() + 60)
+        other = make_expiring_set(RedisCache(client), 'revoked')
+        self.assertIn('token', other)
+        self.assertNotIn('gone', other)
+        self.assertEqual(store, {'motorcycles:revoked:token': 60})
+        self.assertIsInstance(make_expiring_set(LRUCache(), 'revoked'), ExpiringSet)
+
+class TokenRevocationTestCase(unittest.TestCase):
+    def token(self, user):
+        return jwt.encode({'user': user, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+                          app.config['SECRET_KEY'], algorithm="HS256")
+
+    def test_revocation_survives_cache_overflow(self):
+        revoked = self.token('revoked')
+        self.assertIsNotNone(verify_token(revoked))
+        revoke_token(revoked)
+        for n in range(app.config['TOKEN_CACHE_MAX_ENTRIES'] + 1):
+            revoke_token(self.token(f'user-{n}'))
+        self.assertIsNone(verify_token(revoked))
+
+class FakeConnection:
+    def ping(self): pass
+    def rollback(self): pass
+    def close(self): pass
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    def test_reuses_and_times_out(self):
+        pool = ConnectionPool(FakeConnection, max_size=1, timeout=0.05)
+        conn = pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['in_use'], stats['timeouts']), (1, 1, 1))
+
+    def test_recycles_old_connections(self):
+        pool = ConnectionPool(FakeConnection, recycle=-1)
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIsNot(pool.acquire(), conn)
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+    def test_replicas_rotate_and_fail_over(self):
+        def broken():
+            raise OSError('replica down')
+        healthy = ConnectionPool(FakeConnection)
+        replicas = ReplicaSet([('down', ConnectionPool(broken)), ('up', healthy)], retry_after=60)
+        pools = [replicas.acquire()[0] for _ in range(3)]
+        self.assertEqual(pools, [healthy] * 3)
+        stats = replicas.stats()
+        self.assertEqual([r['healthy'] for r in stats['replicas']], [False, True])
+        self.assertEqual(stats['replicas'][0]['failures'], 1)  # skipped while marked down
+        replicas = ReplicaSet([('down', ConnectionPool(broken))])
+        self.assertEqual(replicas.acquire(), (None, None))
+        self.assertEqual(replicas.stats()['fallbacks_to_primary'], 1)
+
+class PasswordHasherTestCase(unittest.TestCase):
+    def test_hash_and_verify(self):
+        hasher = PasswordHasher(iterations=1000)
+        encoded = hasher.hash('secret')
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(hasher.verify('secret', encoded))
+        self.assertFalse(hasher.verify('wrong', encoded))
+        self.assertFalse(hasher.needs_rehash(encoded))
+        self.assertTrue(PasswordHasher(iterations=2000).needs_rehash(encoded))
+
+    def test_legacy_sha256_needs_rehash(self):
+        hasher = PasswordHasher(iterations=1000)
+        legacy = '2bb80d537b1da3e38bd30361aa855686bde0eacd7162fef6a25fe97bf527a25b'  # sha256('secret')
+        self.assertTrue(hasher.verify('secret', legacy))
+        self.assertTrue(hasher.needs_rehash(legacy))
+
+    def test_unknown_user_costs_a_kdf_run(self):
+        hasher = PasswordHasher(iterations=1000)
+        with mock.patch('passwords.hashlib.pbkdf2_hmac', wraps=hashlib.pbkdf2_hmac) as kdf:
+            self.assertFalse(hasher.verify('secret', None))
+        self.assertEqual(kdf.call_args.args[3], 1000)
+        with mock.patch('app.hasher', hasher):
+            resp = app.test_client().post('/login', data={'username': 'no-such-user', 'password': 'secret'})
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(hasher.stats()['verified'], 2)
+
+class InventorySnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.snap = InventorySnapshot()
+        self.snap.load([
+            (1, 'Yamaha', 'R1', 2022, 998, 'Blue'),
+            (2, 'Honda', 'CB650R', 2021, 649, 'Red'),
+            (3, 'Yamaha', 'MT-07', 2023, 689, 'Red'),
+        ])
+
+    def test_filters_and_group_by(self):
+        self.assertEqual(self.snap.count(make='Yamaha', cc_max=700), 1)
+        self.assertEqual(self.snap.count(make='Ducati'), 0)
+        self.assertEqual(self.snap.group_by('color', year_min=2021),
+                         [{'value': 'Red', 'count': 2}, {'value': 'Blue', 'count': 1}])
+
+    def test_incremental_updates(self):
+        self.snap.upsert({'id': 2, 'make': 'Yamaha', 'model': 'R7', 'year': 2022, 'engine_cc': 689, 'color': 'Blue'})
+        self.snap.upsert({'id': 4, 'make': 'KTM', 'model': 'Duke', 'year': 2024, 'engine_cc': 890, 'color': 'Orange'})
+        self.snap.delete(1)
+        self.assertEqual(self.snap.count(), 3)
+        self.assertEqual(self.snap.count(make='Yamaha'), 2)
+        self.assertEqual(self.snap.memory()['rows'], 3)
+
+    def test_scan_runs_on_a_copy_of_the_columns(self):
+        selected = self.snap.select(group='year', make='Yamaha')
+        self.snap.upsert({'id': 4, 'make': 'Yamaha', 'model': 'R3', 'year': 2022, 'engine_cc': 321, 'color': 'Blue'})
+        self.snap.delete(1)
+        self.assertEqual(list(self.snap.matching(selected)), [0, 2])
+        self.assertEqual(self.snap.count(make='Yamaha'), 2)
+
+    def test_writes_during_a_load_neither_block_nor_get_lost(self):
+        def rows():
+            yield (1, 'Yamaha', 'R1', 2022, 998, 'Blue')
+            # Writers arriving mid-load must not wait for it to finish
+            writer = threading.Thread(target=lambda: (
+                self.snap.upsert({'id': 5, 'make': 'KTM', 'model': 'Duke', 'year': 2024, 'engine_cc': 890, 'color': 'Orange'}),
+                self.snap.delete(2)))
+            writer.start()
+            writer.join(1)
+            self.assertFalse(writer.is_alive())
+            self.assertEqual(self.snap.count(make='KTM'), 1)
+            yield (2, 'Honda', 'CB650R', 2021, 649, 'Red')
+        self.snap.load(rows())
+        self.assertEqual(self.snap.count(), 2)
+        self.assertEqual(self.snap.count(make='KTM'), 1)
+        self.assertFalse(self.snap.stale())
+        self.snap.load(iter([(1, 'Yamaha', 'R1', 2022, 998, 'Blue')]))
+        self.assertEqual(self.snap.count(), 1)
+        # A bulk import during the load can't be replayed, so the snapshot stays stale
+        self.snap.load(row for row in [(1, 'Yamaha', 'R1', 2022, 998, 'Blue')] if not self.snap.invalidate())
+        self.assertTrue(self.snap.stale())
+
+    def test_scans_without_numpy(self):
+        for numpy in (snapshot.numpy, None):
+            with mock.patch('snapshot.numpy', numpy):
+                self.assertEqual(self.snap.scan(year_min=2022, year_max=2022), [0])
+                self.assertEqual(self.snap.count(color='Red', cc_min=650), 1)
+                self.assertEqual(self.snap.group_by('year', make='Yamaha'),
+                                 [{'value': 2022, 'count': 1}, {'value': 2023, 'count': 1}])
+                self.assertEqual(self.snap.group_by('make', color='Green'), [])
+
+class MetricsTestCase(unittest.TestCase):
+    def test_prometheus_histograms(self):
+        m = Metrics(buckets=(0.01, 0.1))
+        m.observe('/motorcycles', 'GET', 200, 0.005, {'query': 0.002})
+        m.observe('/motorcycles', 'GET', 200, 0.05, {'query': 0.03, 'render': 0.01})
+        text = m.render()
+        self.assertIn('http_requests_total{route="/motorcycles",method="GET",status="200"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{route="/motorcycles",le="0.01"} 1', text)
+        self.assertIn('http_request_duration_seconds_bucket{route="/motorcycles",le="+Inf"} 2', text)
+        self.assertIn('http_request_phase_seconds_count{route="/motorcycles",phase="query"} 2', text)
+        self.assertIn('http_request_phase_seconds_count{route="/motorcycles",phase="render"} 1', text)
+
+    def test_server_timing(self):
+        header = server_timing({'render': 0.002, 'auth': 0.0001}, 0.005)
+        self.assertEqual(header, 'auth;dur=0.10, render;dur=2.00, total;dur=5.00')
+
+class SQLProfilerTestCase(unittest.TestCase):
+    def test_fingerprint_and_redaction(self):
+        self.assertEqual(fingerprint("SELECT * FROM motorcycles WHERE id IN (%s, %s,  %s) AND make = 'Honda'"),
+                         "SELECT * FROM motorcycles WHERE id IN (?+) AND make = ?")
+        self.assertEqual(fingerprint("SELECT * FROM motorcycles WHERE id IN (%s)"),
+                         "SELECT * FROM motorcycles WHERE id IN (?+)")
+        self.assertEqual(redact(('secret', 42, None)), ['<str len=6>', '<int>', 'NULL'])
+        self.assertEqual(redact([('a', 1), ('b', 2)]), '<2 rows>')
+
+    def test_aggregates_and_n_plus_one(self):
+        profiler = SQLProfiler(slow_ms=1000, n_plus_one=3)
+        with app.test_request_context('/'):
+            for i in range(3):
+                profiler.record("SELECT * FROM motorcycles WHERE id = %s", (i,), 0.002, 1)
+            profiler.record("SELECT COUNT(*) FROM motorcycles", None, 0.010, 1)
+            profiler.finish_request()
+        report = profiler.top(n=1, key='count')
+        self.assertEqual(report['executed'], 4)
+        self.assertEqual(report['statements'][0]['fingerprint'], "SELECT * FROM motorcycles WHERE id = ?")
+        self.assertEqual(report['statements'][0]['count'], 3)
+        self.assertEqual(report['statements'][0]['rows'], 3)
+        self.assertEqual(len(report['n_plus_one']), 1)
+        self.assertEqual(profiler.top(key='total_ms')['statements'][0]['fingerprint'],
+                         "SELECT COUNT(*) FROM motorcycles")
+
+class ChangeFeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.log = []
+        self.fetches = 0
+        self.feed = ChangeFeed(self.fetch, lambda: len(self.log), buffer_size=3, poll_interval=60)
+
+    def fetch(self, since, limit):
+        self.fetches += 1
+        return [e for e in self.log if e['seq'] > since][:limit]
+
+    def write(self, n=1):
+        for _ in range(n):
+            self.log.append({'seq': len(self.log) + 1, 'op': 'insert', 'id': len(self.log) + 1})
+        self.feed.notify()
+
+    def test_serves_new_events_from_buffer(self):
+        self.write(2)
+        self.assertEqual(len(self.feed.wait(0, 10, 0)), 2)  # older than the buffer: read from the db
+        self.write(2)
+        events = self.feed.wait(2, 10, 0)
+        self.assertEqual([e['seq'] for e in events], [3, 4])
+        fetches = self.fetches
+        self.assertEqual([e['seq'] for e in self.feed.wait(3, 10, 0)], [4])
+        self.assertEqual(self.fetches, fetches)  # no notify, so no new query
+        self.assertEqual(self.feed.stats()['head'], 4)
+
+    def test_falls_back_to_database_when_behind(self):
+        self.feed.refresh()
+        self.write(5)
+        self.assertEqual([e['seq'] for e in self.feed.wait(3, 10, 0)], [4, 5])
+        self.assertEqual([e['seq'] for e in self.feed.wait(0, 2, 0)], [1, 2])
+        self.assertEqual(self.feed.stats()['db_reads'], 1)
+
+    def test_wait_times_out_empty(self):
+        self.feed.refresh()
+        self.assertEqual(self.feed.wait(0, 10, 0.01), [])
+
+class AdmissionControllerTestCase(unittest.TestCase):
+    def test_token_bucket(self):
+        buckets = MemoryBuckets(max_keys=2)
+        self.assertEqual([buckets.take('a', 1, 2) for _ in range(2)], [0, 0])
+        self.assertGreater(buckets.take('a', 1, 2), 0)
+        self.assertEqual(buckets.take('b', 1, 2), 0)
+        buckets.take('c', 1, 2)
+        self.assertEqual(buckets.stats()['keys'], 2)
+        self.assertEqual(buckets.take('a', 1, 2), 0)  # evicted, starts full again
+
+    def test_rate_limit_per_user_and_ip(self):
+        admission = AdmissionController(user_rate=1, user_burst=1, ip_rate=1, ip_burst=3, concurrency=0)
+        with admission.admit('/r', 'alice', '10.0.0.1'):
+            pass
+        with self.assertRaises(Rejected) as ctx:
+            with admission.admit('/r', 'alice', '10.0.0.1'):
+                pass
+        self.assertEqual(ctx.exception.status, 429)
+        self.assertGreater(ctx.exception.retry_after, 0)
+        with admission.admit('/r', 'bob', '10.0.0.1'):
+            pass
+        with self.assertRaises(Rejected):
+            with admission.admit('/r', 'carol', '10.0.0.1'):
+                pass
+        counts = {d['decision']: d['count'] for d in admission.stats()['decisions']}
+        self.assertEqual(counts, {'admitted': 2, 'rate_limited_user': 1, 'rate_limited_ip': 1})
+
+    def test_concurrency_cap_sheds(self):
+        admission = AdmissionController(user_rate=0, ip_rate=0, concurrency=1,
+                                        route_concurrency={'/free': 0}, max_wait=0.01)
+        with admission.admit('/r', 'alice', None):
+            with self.assertRaises(Rejected) as ctx:
+                with admission.admit('/r', 'bob', None):
+                    pass
+            self.assertEqual(ctx.exception.status, 503)
+            with admission.admit('/other', 'bob', None), admission.admit('/free', 'bob', None):
+                pass
+        with admission.admit('/r', 'bob', None):
+            pass
+        self.assertIn('admission_decisions_total{route="/r",decision="shed"} 1', admission.render())
+
+    def test_login_and_register_are_rate_limited_per_address(self):
+        admission = AdmissionController(ip_rate=0.01, ip_burst=2)
+        client = app.test_client()
+        with mock.patch('app.admission', admission):
+            statuses = [client.post(path, data={'username': 'nobody', 'password': 'wrong'}).status_code
+                        for path in ('/login', '/register', '/login')]
+        self.assertNotEqual(statuses[0], 429)
+        self.assertEqual(statuses[2], 429)
+        self.assertEqual({d['route'] for d in admission.stats()['decisions']}, {'/login', '/register'})
+
+class GroupCommitterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.written = []
+        self.batches = []
+
+    def write(self, rows):
+        if 'bad' in rows:
+            raise ValueError('bad row')
+        self.batches.append(len(rows))
+        first = len(self.written) + 1
+        self.written += rows
+        return list(range(first, first + len(rows)))
+
+    def submit_all(self, committer, rows):
+        results = {}
+        def submit(row):
+            try:
+                results[row] = committer.submit(row)
+            except (ValueError, ConnectionError) as e:
+                results[row] = e
+        threads = [threading.Thread(target=submit, args=(row,)) for row in rows]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_batches_and_returns_each_callers_id(self):
+        committer = GroupCommitter(self.write, max_batch=10, max_delay=0.2)
+        results = self.submit_all(committer, [f'row{i}' for i in range(10)])
+        committer.close()
+        self.assertEqual(self.batches, [10])
+        for row, id in results.items():
+            self.assertEqual(self.written[id - 1], row)
+
+    def test_bad_row_only_fails_its_caller(self):
+        committer = GroupCommitter(self.write, max_batch=3, max_delay=0.2)
+        results = self.submit_all(committer, ['a', 'bad', 'b'])
+        committer.close()
+        self.assertIsInstance(results['bad'], ValueError)
+        self.assertEqual(sorted(self.written), ['a', 'b'])
+        self.assertEqual(committer.stats()['failed'], 1)
+
+    def test_connection_error_fails_the_batch_once(self):
+        calls = []
+        def write(rows):
+            calls.append(rows)
+            raise ConnectionError('database unreachable')
+        committer = GroupCommitter(write, max_batch=3, max_delay=0.2, row_errors=(ValueError,))
+        results = self.submit_all(committer, ['a', 'b', 'c'])
+        committer.close()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(e, ConnectionError) for e in results.values()))
+        self.assertEqual(committer.stats()['failed'], 3)
+
+    def test_admission_lets_a_full_batch_through(self):
+        # Twenty concurrent creates behind an admission cap of 8 still share one batch
+        admission = AdmissionController(user_rate=0, ip_rate=0, concurrency=8, max_wait=0.5)
+        admission.raise_limit('/motorcycles/new', 20)
+        committer = GroupCommitter(self.write, max_batch=20, max_delay=5)
+        token = jwt.encode({'user': 'batch-test', 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+                           app.config['SECRET_KEY'], algorithm='HS256')
+        statuses = []
+        def create(n):
+            resp = app.test_client().post('/motorcycles/new', headers={'x-access-token': token}, data={
+                'make': f'Batch{n}', 'model': 'M', 'year': 2024, 'engine_cc': 500, 'color': 'Red'})
+            statuses.append(resp.status_code)
+        with mock.patch('app.admission', admission), mock.patch('app.create_buffer', committer):
+            threads = [threading.Thread(target=create, args=(n,)) for n in range(20)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        committer.close()
+        self.assertEqual(statuses, [302] * 20)
+        self.assertEqual(self.batches, [20])
+
+    def test_queue_full_and_shutdown(self):
+        committer = GroupCommitter(self.write, max_queue=0, timeout=0.01)
+        with self.assertRaises(WriteQueueFull):
+            committer.submit('a')
+        committer.close()
+        with self.assertRaises(WriteQueueFull):
+            committer.submit('a')
+
+class BenchmarkHelpersTestCase(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_seed_data(self):
+        sql = open(SCHEMA_FILE).read()
+        statements = list(schema_statements(sql))
+        self.assertTrue(all('motorcycles_db' not in s for s in statements))
+        self.assertEqual(len(statements), 8)
+        samples = sample_rows(sql)
+        rows = list(synthetic_rows(samples, 100, seed=1))
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(rows, list(synthetic_rows(samples, 100, seed=1)))
+        self.assertEqual({r[0] for r in rows}, {s[0] for s in samples})
+
+    def test_reseed_drops_every_table(self):
+        executed = []
+        cursor = mock.Mock(execute=lambda sql, params=None: executed.append(sql))
+        with mock.patch('bench.connect', return_value=mock.Mock(cursor=lambda: cursor)):
+            seed('bench_db', 10)
+        drop = next(sql for sql in executed if sql.startswith('DROP TABLE'))
+        for table in re.findall(r'CREATE TABLE (\w+)', '\n'.join(executed)):
+            self.assertIn(table, drop)
+        # Triggers come after the bulk load, so seeding leaves the change log empty
+        self.assertTrue(all(sql.startswith('CREATE TRIGGER') for sql in executed[-3:]))
+        self.assertEqual(cursor.executemany.call_count, 1)
+
+    def test_peak_rss_is_per_scenario(self):
+        driver = InProcessDriver('token')
+        blob = b'x' * (64 * 1024 * 1024)
+        del blob
+        lifetime_peak = driver.peak_rss_kb()
+        with mock.patch.object(driver, 'request', return_value=200):
+            result = run_scenario(driver, lambda rng: ('GET', '/', None), 10, 2)
+        if result['peak_rss_scope'] != 'scenario':
+            self.skipTest('peak RSS can only be reset on Linux')
+        self.assertLess(result['peak_rss_kb'], lifetime_peak - 32 * 1024)
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()